@@ -0,0 +1,59 @@
+"""Builds the index of reference entities that language packs are checked
+against. Each application's reference language pack (in
+validator/testcases/langpacks/) is parsed once here, so that validations
+only need to parse the language pack that is being tested.
+
+    python extras/build_langpack_index.py [-o index.json.gz] [app ...]
+
+Run this again whenever a reference language pack changes. Packages that
+have changed since the index was built are parsed at runtime instead."""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from validator.testcases import l10ncompleteness
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Build the langpack reference entity index.")
+    parser.add_argument("apps",
+                        nargs="*",
+                        help="The applications to index (Default: every "
+                             "bundled language pack)")
+    parser.add_argument("-o",
+                        "--output",
+                        default=l10ncompleteness.LANGPACK_INDEX,
+                        help="The index to write")
+    args = parser.parse_args()
+
+    apps = args.apps or sorted(name[:-4] for name in
+                               os.listdir(l10ncompleteness.LANGPACK_DIR) if
+                               name.endswith(".xpi"))
+
+    index = {}
+    for app in apps:
+        path = os.path.join(l10ncompleteness.LANGPACK_DIR, "%s.xpi" % app)
+        index[app] = l10ncompleteness.index_reference_pack(path)
+
+    # latin-1 maps every byte to a character, so the entities come back
+    # byte for byte.
+    temp_path = "%s.tmp" % args.output
+    output = gzip.open(temp_path, "wb")
+    try:
+        json.dump(index, output, encoding="latin-1", sort_keys=True,
+                  separators=(",", ":"))
+    finally:
+        output.close()
+    os.rename(temp_path, args.output)
+
+    print "Indexed %d language packs in %s" % (len(index), args.output)
+
+
+if __name__ == "__main__":
+    main()
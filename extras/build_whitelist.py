@@ -1,17 +1,127 @@
-import sys
-import os
-import os.path as pth
+"""Builds the binary known-file database that the validator consults for
+whitelisted files. Each source may be a directory (every file below it is
+hashed), an XPI or JAR package (every member is hashed), or a text file of
+hashes in the whitelist_hashes.txt format.
+
+    python extras/build_whitelist.py [-o whitelist_hashes.db] source ...
+    python extras/build_whitelist.py --text [-o whitelist_hashes.txt] ...
+
+Copy the result into validator/testcases/ to have it used in place of
+whitelist_hashes.txt. With --text, a new whitelist_hashes.txt is written
+instead, one "hash size" line per file.
+
+The size of each file is kept along with its hash, so that files of other
+sizes aren't hashed at all. That only works if every size is known, and
+hash lists without sizes don't have them."""
+
+import argparse
+import binascii
 import hashlib
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from validator.testcases import hashdb
+
+
+def hash_directory(path):
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            file_ = open(os.path.join(root, filename), "rb")
+            try:
+                data = file_.read()
+            finally:
+                file_.close()
+            yield hashlib.sha1(data).digest(), len(data)
+
+
+def hash_package(path):
+    package = zipfile.ZipFile(path)
+    try:
+        for info in package.infolist():
+            if info.filename.endswith("/"):
+                continue
+            yield (hashlib.sha1(package.read(info.filename)).digest(),
+                   info.file_size)
+    finally:
+        package.close()
+
+
+def hash_list(path):
+    definitions = open(path)
+    try:
+        for line in definitions:
+            fields = line.split()
+            if fields:
+                size = int(fields[1]) if len(fields) > 1 else None
+                yield fields[0], size
+    finally:
+        definitions.close()
+
+
+def hash_source(path):
+    if os.path.isdir(path):
+        return hash_directory(path)
+    elif zipfile.is_zipfile(path):
+        return hash_package(path)
+    return hash_list(path)
+
+
+def write_text(digests, path):
+    """Writes the digests out as a hash list, with the size of each file
+    where it's known."""
+
+    lines = set()
+    for digest, size in digests:
+        if len(digest) == hashdb.DIGEST_SIZE:
+            digest = binascii.hexlify(digest)
+        lines.add(digest if size is None else "%s %d" % (digest, size))
+
+    output = open(path, "w")
+    try:
+        for line in sorted(lines):
+            output.write("%s\n" % line)
+    finally:
+        output.close()
+    return len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Build a known-file hash database.")
+    parser.add_argument("sources",
+                        nargs="+",
+                        help="Directories, packages, or hash lists to "
+                             "include in the database")
+    parser.add_argument("-o",
+                        "--output",
+                        help="The database to write (Default: "
+                             "whitelist_hashes.db, or whitelist_hashes.txt "
+                             "with --text)")
+    parser.add_argument("--no-bloom",
+                        action="store_false",
+                        dest="bloom",
+                        help="Leave the bloom filter out of the database")
+    parser.add_argument("--text",
+                        action="store_true",
+                        help="Write a text hash list instead of a database")
+    args = parser.parse_args()
 
-output = open("whitelist_hashes.txt", mode="w")
+    def digests():
+        for source in args.sources:
+            for digest in hash_source(source):
+                yield digest
 
-for root, dirs, files in os.walk(sys.argv[1]):
-    for filename in files:
-        path = pth.join(pth.dirname(pth.abspath(sys.argv[0])),
-                        root, filename)
-        hash = hashlib.sha1(open(path).read()).hexdigest()
-        print path, hash
-        output.write(hash + "\n")
+    if args.text:
+        output = args.output or "whitelist_hashes.txt"
+        count = write_text(digests(), output)
+    else:
+        output = args.output or "whitelist_hashes.db"
+        count = hashdb.build(digests(), output, bloom=args.bloom)
+    print "Wrote %d hashes to %s" % (count, output)
 
-output.close()
 
+if __name__ == "__main__":
+    main()
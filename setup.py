@@ -1,9 +1,15 @@
+import re
+
 from setuptools import setup, find_packages
 
+# The version lives in the package, which can't be imported before its
+# requirements are installed.
+version = re.search(r'__version__ = "(.*)"',
+                    open('validator/__init__.py').read()).group(1)
 
 setup(
     name='amo-validator',
-    version='1.0',
+    version=version,
     description='Validates addons for Mozilla products.',
     long_description=open('README.rst').read(),
     author='Matt Basta',
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""A stand-in for the SpiderMonkey shell that speaks the worker protocol.
+Sources containing "crash" make it exit, sources containing "broken" make
+it print garbage, sources containing "hang" make it stop answering, and
+everything else parses to an empty program."""
+
+import json
+import sys
+import time
+
+PROGRAM = {"type": "Program", "body": []}
+
+while True:
+    length = sys.stdin.readline()
+    if not length:
+        break
+    length = int(length)
+    source = ""
+    while len(source) < length:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        source += line.rstrip("\n")
+
+    if "crash" in source:
+        sys.exit(1)
+    elif "hang" in source:
+        time.sleep(3600)
+    elif "broken" in source:
+        sys.stdout.write("{not json\n")
+    elif source.startswith("{"):
+        batch = json.loads(source)
+        sys.stdout.write(json.dumps(dict((id, PROGRAM) for id in batch)))
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(json.dumps(PROGRAM) + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+import validator.batch as batch
+
+def test_collect_paths():
+    "Tests that directories and manifests are expanded into packages."
+
+    path = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(path, "sub"))
+        for name in ("b.xpi", "a.jar", "notes.txt", "sub/c.xpi"):
+            open(os.path.join(path, name), "w").close()
+
+        manifest = os.path.join(path, "manifest.txt")
+        open(manifest, "w").write("# Comment\n\nfoo.xpi\n  bar.xpi  \n")
+
+        paths = batch.collect_paths(["x.xpi", path], manifest)
+        assert paths == ["x.xpi",
+                         os.path.join(path, "a.jar"),
+                         os.path.join(path, "b.xpi"),
+                         os.path.join(path, "sub", "c.xpi"),
+                         "foo.xpi",
+                         "bar.xpi"]
+    finally:
+        shutil.rmtree(path)
+
+def test_run_batch():
+    "Tests that each package gets one line of output."
+
+    def fake_validate(path, format, **options):
+        assert format == "json"
+        if path == "broken.xpi":
+            raise Exception("Oops")
+        return json.dumps({"success": path == "good.xpi"})
+
+    validate = batch.validate
+    batch.validate = fake_validate
+    try:
+        output = StringIO()
+        failures = batch.run_batch(["good.xpi", "bad.xpi", "broken.xpi"],
+                                   output)
+    finally:
+        batch.validate = validate
+
+    assert failures == 2
+    lines = [json.loads(line) for line in
+             output.getvalue().splitlines()]
+    assert len(lines) == 3
+    assert lines[0] == {"path": "good.xpi", "result": {"success": True}}
+    assert lines[1]["result"] == {"success": False}
+    assert lines[2]["path"] == "broken.xpi"
+    assert "Oops" in lines[2]["error"]
+
+def _slow_validate(path, format, **options):
+    if path == "slow.xpi":
+        time.sleep(5)
+    elif path == "guarded.xpi":
+        # Catch-all handlers in the tests mustn't swallow the timeout.
+        try:
+            time.sleep(5)
+        except Exception:
+            pass
+    return json.dumps({"success": True})
+
+def test_timeout():
+    "Tests that a package that takes too long is abandoned."
+
+    validate = batch.validate
+    batch.validate = _slow_validate
+    try:
+        start = time.time()
+        line, failed = batch.run_job(("slow.xpi", {}, 1))
+        assert time.time() - start < 4
+        assert failed
+        assert "timed out" in json.loads(line)["error"]
+
+        start = time.time()
+        line, failed = batch.run_job(("guarded.xpi", {}, 1))
+        assert time.time() - start < 4
+        assert failed
+        assert "timed out" in json.loads(line)["error"]
+
+        line, failed = batch.run_job(("fast.xpi", {}, 1))
+        assert not failed
+    finally:
+        batch.validate = validate
+
+def test_run_parallel():
+    "Tests that packages can be validated in worker processes."
+
+    validate = batch.validate
+    batch.validate = _slow_validate
+    try:
+        paths = ["%d.xpi" % i for i in range(10)]
+        output = StringIO()
+        failures = batch.run_parallel(paths, 3, output, ordered=True,
+                                      max_tasks=2)
+    finally:
+        batch.validate = validate
+
+    assert failures == 0
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["path"] for line in lines] == paths
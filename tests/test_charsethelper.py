@@ -35,3 +35,34 @@ def test_utf32le():
 def test_utf32be():
     "Tests utf-32 Big Endian encoding is properly decoded"
     _do_test("tests/resources/charsethelper/utf-32be.txt")
+
+def test_detect_fast_path():
+    "Tests that ASCII and UTF-8 are recognized without chardet"
+    
+    assert charsethelper.detect("plain text\n")["encoding"] == "ascii"
+    assert charsethelper.detect("")["encoding"] == "ascii"
+    assert charsethelper.detect(u"täst".encode("utf-8"))["encoding"] == \
+        "utf-8"
+    # Escape sequences may belong to a 7-bit encoding.
+    assert charsethelper.detect("\x1b$B") != \
+        {"encoding": "ascii", "confidence": 1.0}
+
+def test_detect_sample():
+    "Tests that chardet only sees the head of the data"
+    
+    fed = []
+    feed = charsethelper.UniversalDetector.feed
+    def count_feed(self, data):
+        fed.append(len(data))
+        return feed(self, data)
+    
+    charsethelper.UniversalDetector.feed = count_feed
+    try:
+        text = u"Les élèves étaient très fâchés à côté de l'été. " * 20000
+        result = charsethelper.detect(text.encode("latin-1"))
+    finally:
+        charsethelper.UniversalDetector.feed = feed
+    
+    assert result["encoding"]
+    assert sum(fed) <= charsethelper.DETECT_MAX_BYTES
+    assert charsethelper.decode(text.encode("utf-16")) == text
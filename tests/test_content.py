@@ -1,9 +1,17 @@
+import hashlib
 import os
+import shutil
+import tempfile
 
 from StringIO import StringIO
 
 import validator.xpi as xpi
 import validator.testcases.content as content
+import validator.testcases.scripting as scripting
+import validator.testcases.javascript.spidermonkey as spidermonkey
+import validator.testcases.markup.csstester as csstester
+import validator.testcases.markup.markuptester as markuptester
+from validator.resultcache import DirectoryResultCache
 from validator.errorbundler import ErrorBundle
 from helper import _do_test
 from validator.constants import *
@@ -188,6 +196,133 @@ def test_jar_subpackage_bad():
     assert err.failed()
     
 
+def test_file_cache():
+    "Tests that unchanged files replay their cached messages."
+    
+    path = tempfile.mkdtemp()
+    try:
+        file_cache = DirectoryResultCache(path)
+        mock_package = MockXPIManager(
+            {"foo.css": "tests/resources/markup/csstester/identity-box.css",
+             "bar.css": "tests/resources/markup/csstester/identity-box.css"})
+        
+        content.testendpoint_css = csstester
+        err = ErrorBundle(None, True)
+        err.save_resource("FILE_CACHE", file_cache)
+        content.test_packed_packages(err,
+                                     {"foo.css": {"extension": "css",
+                                                  "name_lower": "foo.css"}},
+                                     mock_package)
+        assert len(err.warnings) == 1
+        
+        # The same contents under a different name come out of the cache.
+        content.testendpoint_css = MockTestEndpoint(("test_css_file", ))
+        err = ErrorBundle(None, True)
+        err.save_resource("FILE_CACHE", file_cache)
+        result = content.test_packed_packages(
+                                    err,
+                                    {"bar.css": {"extension": "css",
+                                                 "name_lower": "bar.css"}},
+                                    mock_package)
+        assert result == 1
+        content.testendpoint_css.assert_expectation("test_css_file", 0)
+        assert len(err.warnings) == 1
+        assert err.warnings[0]["file"] == "bar.css"
+        assert err.warnings[0]["id"] == ("testcases_markup_csstester",
+                                         "_run_css_tests",
+                                         "identity_box")
+    finally:
+        content.testendpoint_css = csstester
+        shutil.rmtree(path)
+
+
+def test_file_cache_reject():
+    "Tests that cached files that rejected the package still reject it."
+
+    path = tempfile.mkdtemp()
+    markup = content.testendpoint_markup
+    try:
+        file_cache = DirectoryResultCache(path)
+        mock_package = MockXPIManager(
+            {"foo.html":
+                 "tests/resources/markup/markuptester/_langpack/lp_remote.html"})
+        contents = {"foo.html": {"extension": "html",
+                                 "name_lower": "foo.html"}}
+
+        content.testendpoint_markup = markuptester
+        for attempt in range(2):
+            err = ErrorBundle(None, True)
+            err.set_type(PACKAGE_LANGPACK)
+            err.save_resource("FILE_CACHE", file_cache)
+            content.test_packed_packages(err, contents, mock_package)
+            assert err.warnings
+            assert err.reject
+
+            # The second time around, the file comes out of the cache.
+            content.testendpoint_markup = MockMarkupEndpoint(
+                                                ("process", ))
+        content.testendpoint_markup.assert_expectation("process", 0)
+    finally:
+        content.testendpoint_markup = markup
+        shutil.rmtree(path)
+
+
+def test_file_cache_shell_failure():
+    "Tests that files that the JS shell failed on aren't cached."
+
+    path = tempfile.mkdtemp()
+    package = tempfile.mkdtemp()
+    endpoint = content.testendpoint_js
+    installation = scripting.SPIDERMONKEY_INSTALLATION
+    test_js_file = scripting.test_js_file
+    shell = "tests/resources/spidermonkey/fakeshell.py"
+    try:
+        file_cache = DirectoryResultCache(path)
+        files = {"crash.js": "crash();",
+                 "weird.js": "foo(\x01);"}
+        contents = {}
+        for name, data in files.items():
+            with open(os.path.join(package, name), "w") as output:
+                output.write(data)
+            contents[name] = {"extension": "js", "name_lower": name}
+        mock_package = MockXPIManager(
+            dict((name, os.path.join(package, name)) for name in files))
+
+        content.testendpoint_js = scripting
+        scripting.SPIDERMONKEY_INSTALLATION = shell
+        err = ErrorBundle(None, True)
+        err.save_resource("SPIDERMONKEY", shell)
+        err.save_resource("FILE_CACHE", file_cache)
+        content.test_packed_packages(err, contents, mock_package)
+        assert sorted(message["file"] for message in err.warnings) == \
+               ["crash.js", "weird.js"]
+        assert any(spidermonkey.is_shell_failure(message) for
+                   message in err.warnings)
+
+        # The second time around, only the file that the shell failed on
+        # is tested again.
+        tested = []
+        def recording_test_js_file(err, filename, data, *args, **kwargs):
+            tested.append(filename)
+            return test_js_file(err, filename, data, *args, **kwargs)
+        scripting.test_js_file = recording_test_js_file
+
+        err = ErrorBundle(None, True)
+        err.save_resource("SPIDERMONKEY", shell)
+        err.save_resource("FILE_CACHE", file_cache)
+        content.test_packed_packages(err, contents, mock_package)
+        assert tested == ["crash.js"]
+        assert sorted(message["file"] for message in err.warnings) == \
+               ["crash.js", "weird.js"]
+    finally:
+        content.testendpoint_js = endpoint
+        scripting.SPIDERMONKEY_INSTALLATION = installation
+        scripting.test_js_file = test_js_file
+        spidermonkey.close_pools()
+        shutil.rmtree(path)
+        shutil.rmtree(package)
+
+
 class MockTestEndpoint(object):
     """Simulates a test module and reports whether individual tests
     have been attempted on it."""
@@ -268,5 +403,8 @@ class MockXPIManager(object):
             resource.close()
         
             return data
-        
     
+    def get_hash(self, filename):
+        "Simulates the hashing of a file in the package."
+        
+        return hashlib.sha1(self.read(filename)).hexdigest()
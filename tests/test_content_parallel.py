@@ -0,0 +1,212 @@
+import os
+import zipfile
+from StringIO import StringIO
+
+import validator.loader
+import validator.submain as submain
+import validator.testcases.content as content
+import validator.testcases.charsethelper as charsethelper
+import validator.testcases.langpack as langpack
+import validator.testcases.markup.csstester as csstester
+import validator.testcases.markup.markuptester as markuptester
+import validator.testcases.scripting as scripting
+import validator.testcases.javascript.spidermonkey as spidermonkey
+from validator import workerpool
+from validator.constants import PACKAGE_LANGPACK
+from validator.errorbundler import ErrorBundle
+from validator.xpi import XPIManager
+
+FAKE_SHELL = "tests/resources/spidermonkey/fakeshell.py"
+RESOURCES = ("tests/resources/markup/csstester",
+             "tests/resources/markup/markuptester",
+             "tests/resources/markup/markuptester/_langpack")
+
+def _build_package(copies=4):
+    "Builds a package out of every markup and CSS test file, many times."
+
+    output = StringIO()
+    package = zipfile.ZipFile(output, "w")
+    for copy in range(copies):
+        for directory in RESOURCES:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    package.write(path, "%d/%s" % (copy, name))
+    package.writestr("empty.css", "")
+    package.close()
+    return output.getvalue()
+
+def _build_nested_package():
+    "Builds a package out of several JARs and XPIs."
+
+    output = StringIO()
+    package = zipfile.ZipFile(output, "w")
+    for copy in range(3):
+        package.writestr("chrome/%d.jar" % copy, _build_package(1))
+        package.writestr("addons/%d.xpi" % copy, _build_package(1))
+    package.write("tests/resources/content/subpackage.jar", "sub.jar")
+    package.write("tests/resources/content/junk.xpi", "junk.xpi")
+    package.close()
+    return output.getvalue()
+
+def _build_js_package():
+    """Builds a package out of JS files with control characters in them,
+    mixed in with CSS files."""
+
+    output = StringIO()
+    package = zipfile.ZipFile(output, "w")
+    for copy in range(60):
+        package.writestr("content/%d.js" % copy,
+                         "foo(\x01);\nnetwork.http.foo = %d;" % copy)
+        if copy % 10 == 0:
+            package.write("tests/resources/markup/csstester/identity-box.css",
+                          "skin/%d.css" % copy)
+    package.close()
+    return output.getvalue()
+
+def _build_multi_package():
+    """Builds a package out of several XPIs, each with an install.rdf that
+    fails the first tier and with markup that later tiers complain
+    about."""
+
+    conduit = zipfile.ZipFile("tests/resources/conduit/conduit_updateurl.xpi")
+    output = StringIO()
+    package = zipfile.ZipFile(output, "w")
+    for copy in range(3):
+        addon = StringIO()
+        addon_package = zipfile.ZipFile(addon, "w")
+        for name in conduit.namelist():
+            addon_package.writestr(name, conduit.read(name))
+        addon_package.write(
+                "tests/resources/markup/markuptester/remote_src.xul",
+                "content/remote_src.xul")
+        addon_package.close()
+        package.writestr("%d.xpi" % copy, addon.getvalue())
+    package.close()
+    conduit.close()
+    return output.getvalue()
+
+def _test(workers, detected_type=0, build=_build_package, listed=True,
+          determined=True, shell=None):
+    """Runs test_packed_packages and returns its count, its messages and
+    whether it rejected the package."""
+
+    package = XPIManager(StringIO(build()), "parallel.xpi")
+    err = ErrorBundle(listed=listed, determined=determined)
+    err.set_type(detected_type)
+    err.tier = 2
+    if workers:
+        err.save_resource("FILE_WORKERS", workers)
+    if shell:
+        err.save_resource("SPIDERMONKEY", shell)
+    count = content.test_packed_packages(err, package.get_file_data(),
+                                         package)
+    err.render_contexts()
+
+    messages = []
+    for type_ in ("errors", "warnings", "notices"):
+        for message in getattr(err, type_):
+            message = dict(message)
+            del message["uid"]
+            messages.append((type_, message))
+    return count, messages, err.reject, err.unfinished
+
+def test_parallel_matches_serial():
+    "Tests that the workers produce the same output as a single process."
+
+    endpoints = _use_real_endpoints()
+    min_files = content.MIN_PARALLEL_FILES
+    content.MIN_PARALLEL_FILES = 10
+    try:
+        for detected_type in (0, PACKAGE_LANGPACK):
+            serial = _test(None, detected_type)
+            assert serial[0]
+            assert serial[1]
+            # Remote links only reject language packs.
+            assert serial[2] == (detected_type == PACKAGE_LANGPACK)
+            assert _test(3, detected_type) == serial
+            assert 3 in workerpool.POOLS
+    finally:
+        _restore_endpoints(endpoints)
+        content.MIN_PARALLEL_FILES = min_files
+        workerpool.close_pools()
+
+    # JS messages come out in the same order, too.
+    endpoints = _use_real_endpoints()
+    installation = scripting.SPIDERMONKEY_INSTALLATION
+    scripting.SPIDERMONKEY_INSTALLATION = FAKE_SHELL
+    try:
+        serial = _test(None, build=_build_js_package,
+                       shell=FAKE_SHELL)
+        files = [message["file"] for type_, message in serial[1] if
+                 message["id"][2] == "control_char_filter"]
+        assert sorted(files) == sorted("content/%d.js" % copy for
+                                       copy in range(60))
+        assert any(message["file"] == "skin/10.css" for
+                   type_, message in serial[1])
+        assert _test(3, build=_build_js_package,
+                     shell=FAKE_SHELL) == serial
+    finally:
+        _restore_endpoints(endpoints)
+        scripting.SPIDERMONKEY_INSTALLATION = installation
+        workerpool.close_pools()
+        spidermonkey.close_pools()
+
+def test_parallel_nested_packages():
+    "Tests that nested packages are tested the same way by the workers."
+
+    endpoints = _use_real_endpoints()
+    try:
+        serial = _test(None, build=_build_nested_package)
+        assert serial[1]
+        assert any(message["file"][0] == "junk.xpi" for
+                   type_, message in serial[1])
+        assert any(message["file"][0] == "addons/1.xpi" for
+                   type_, message in serial[1])
+        assert _test(3, build=_build_nested_package) == serial
+        assert 3 in workerpool.POOLS
+    finally:
+        _restore_endpoints(endpoints)
+        workerpool.close_pools()
+
+def test_parallel_bundle_options():
+    "Tests that the workers honor the options of the error bundle."
+
+    endpoints = _use_real_endpoints()
+    try:
+        results = {}
+        for listed in (True, False):
+            for determined in (True, False):
+                serial = _test(None, build=_build_multi_package,
+                               listed=listed, determined=determined)
+                assert serial[1]
+                assert _test(3, build=_build_multi_package, listed=listed,
+                             determined=determined) == serial
+                results[listed, determined] = serial
+
+        # The options make a difference to begin with.
+        assert len(results[True, True][1]) > len(results[False, True][1])
+        assert len(results[True, True][1]) > len(results[True, False][1])
+        assert results[True, False][3]
+    finally:
+        _restore_endpoints(endpoints)
+        workerpool.close_pools()
+
+def _use_real_endpoints():
+    "Other tests replace the endpoints with mocks; this puts them back."
+
+    endpoints = (content.testendpoint_markup, content.testendpoint_css,
+                 content.testendpoint_js, content.testendpoint_langpack,
+                 content.testendpoint_validator, content.charsethelper)
+    content.testendpoint_markup = markuptester
+    content.testendpoint_css = csstester
+    content.testendpoint_js = scripting
+    content.testendpoint_langpack = langpack
+    content.testendpoint_validator = submain
+    content.charsethelper = charsethelper
+    return endpoints
+
+def _restore_endpoints(endpoints):
+    (content.testendpoint_markup, content.testendpoint_css,
+     content.testendpoint_js, content.testendpoint_langpack,
+     content.testendpoint_validator, content.charsethelper) = endpoints
@@ -0,0 +1,139 @@
+import os
+
+from validator.context import (LocaleCache, ValidationContext, get_context,
+                               load_approved_applications)
+from validator.errorbundler import ErrorBundle
+from validator.validate import validate
+from validator.rdf import RDFParser
+from validator.xpi import XPIManager
+import validator.submain
+import validator.testcases.l10ncompleteness as l10n
+import validator.testcases.targetapplication as targetapp
+
+APPS = "validator/app_versions.json"
+
+def test_bundle_context():
+    "Tests that every bundle has a context of its own."
+
+    first = ErrorBundle()
+    second = ErrorBundle()
+    assert first.context is not second.context
+    assert first.context.locale_cache is not second.context.locale_cache
+    assert not first.context.debug
+
+    context = ValidationContext(debug=True)
+    assert ErrorBundle(context=context).context is context
+
+    # Mock bundles get a default context.
+    assert get_context(None).approved_applications is None
+
+def test_approved_applications_shared():
+    "Tests that the application list is only loaded once."
+
+    apps = load_approved_applications(APPS)
+    assert apps
+    assert load_approved_applications(APPS) is apps
+
+def test_context_approved_applications():
+    "Tests that the approved applications come from the context."
+
+    path = "tests/resources/targetapplication/bad_min.xpi"
+    package = XPIManager(open(path, "rb"), path)
+
+    def run(context):
+        err = ErrorBundle(context=context)
+        err.save_resource("has_install_rdf", True)
+        err.save_resource("install_rdf",
+                          RDFParser(package.read("install.rdf")))
+        targetapp.test_targetedapplications(err, package.get_file_data(),
+                                            package)
+        return err
+
+    apps = load_approved_applications(APPS)
+    approved = targetapp.APPROVED_APPLICATIONS
+    targetapp.APPROVED_APPLICATIONS = {}
+    try:
+        assert run(ValidationContext(approved_applications=apps)).failed()
+
+        # Without any approved applications, nothing can be checked.
+        assert not run(ValidationContext(approved_applications={})).failed()
+    finally:
+        targetapp.APPROVED_APPLICATIONS = approved
+
+def test_locale_cache():
+    "Tests that the locale cache drops the least recently used packages."
+
+    cache = LocaleCache(max_entries=2, max_size=10)
+    cache.set("a", "A", 4)
+    cache.set("b", "B", 4)
+    assert cache.get("a") == "A"
+
+    # "b" is the least recently used, so it goes first.
+    cache.set("c", "C", 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+    # Going over the size limit evicts as well.
+    cache.set("d", "D", 8)
+    assert len(cache) == 1
+    assert cache.get("d") == "D"
+
+    # Packages too large for the cache aren't stored.
+    cache.set("e", "E", 11)
+    assert cache.get("e") is None
+
+    assert cache.stats() == {"entries": 1, "size": 8, "hits": 4,
+                             "misses": 2, "evictions": 3}
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == 4
+
+def test_locale_cache_contents():
+    "Tests that locale packages are cached by their contents."
+
+    err = ErrorBundle()
+    first = XPIManager("tests/resources/l10n/langpack/pass.jar")
+    second = XPIManager("tests/resources/l10n/langpack/missing_file.jar")
+    first.read = second.read = lambda name: \
+        open("tests/resources/l10n/langpack/%s" % name, "rb").read()
+    first.get_hash = lambda name: "first"
+    second.get_hash = lambda name: "second"
+
+    one = l10n._get_locale_manager(err, first, "pass.jar", {"pass.jar": {}})
+    assert l10n._get_locale_manager(err, first, "pass.jar",
+                                    {"pass.jar": {}}) is one
+    # The same path in another package isn't mistaken for the first.
+    two = l10n._get_locale_manager(err, second, "pass.jar", {"pass.jar": {}})
+    assert two is not one
+    assert err.context.locale_cache.stats()["hits"] == 1
+
+    # Cached packages are charged for the members that they may hold.
+    size = os.path.getsize("tests/resources/l10n/langpack/pass.jar")
+    assert one.max_memory == l10n.LOCALE_MAX_MEMORY
+    assert err.context.locale_cache.stats()["size"] == \
+           2 * (size + l10n.LOCALE_MAX_MEMORY)
+
+def test_locale_cache_metadata():
+    "Tests that the use of the locale cache is reported in the metadata."
+
+    def prepare_package(err, path, expectation, filename, data):
+        cache = get_context(err).locale_cache
+        for attempt in range(2):
+            if cache.get("foo") is None:
+                cache.set("foo", "bar", 3)
+
+    original = validator.submain.prepare_package
+    validator.submain.prepare_package = prepare_package
+    try:
+        err = validate("tests/resources/xpi/install_rdf_only.xpi",
+                       format=None)
+        assert err.metadata["locale_cache"] == {"entries": 1, "size": 3,
+                                                "hits": 1, "misses": 1,
+                                                "evictions": 0}
+    finally:
+        validator.submain.prepare_package = original
+
+    # Packages that don't open any locales don't mention the cache.
+    err = validate("tests/resources/xpi/install_rdf_only.xpi", format=None)
+    assert "locale_cache" not in err.metadata
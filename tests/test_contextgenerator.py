@@ -87,3 +87,33 @@ def test_get_line():
     print c.get_line(10000)
     assert c.get_line(10000) == 11
 
+
+def test_get_line_matches_lines():
+    "Tests that every position maps to the line and column it's on"
+
+    d = "ab\n\ncdef\n\n\nghi\n"
+    c = ContextGenerator(d)
+
+    line = 1
+    column = 0
+    for position, char in enumerate(d):
+        assert c.get_line(position) == line
+        assert c.get_column(position) == column
+        if char == "\n":
+            line += 1
+            column = 0
+        else:
+            column += 1
+
+    assert c.get_line(len(d)) == len(d.split("\n"))
+    assert c.get_line(-5) == 1
+
+def test_lazy():
+    "Tests that the data isn't split until it's needed"
+
+    c = ContextGenerator("abc\ndef")
+    assert c._lines is None
+    assert c._line_ends is None
+    assert c.get_line(5) == 2
+    assert c._lines is None
+    assert c.get_context(2)[1] == "def"
@@ -1,5 +1,6 @@
 import os
 
+import validator.errorbundler
 import validator.testcases.charsethelper
 import validator.testcases.scripting
 
@@ -47,3 +48,24 @@ def test_controlchars_bad():
     errs = _do_test("tests/resources/controlchars/controlchars_bad.js")
     assert len(errs.ids) == 2 and errs.ids[1][2] == 'syntax_error'
 
+
+def test_strip_weird_chars_position():
+    """Tests that control characters are stripped and that the first one is
+    reported at its line and column"""
+
+    err = validator.errorbundler.ErrorBundle()
+    code = validator.testcases.scripting.strip_weird_chars(
+            u"var a;\r\n\tvar b\x01 = 1;\x02\n", err, "foo.js")
+
+    assert code == u"var a;\r\n\tvar b = 1;\n\n"
+    assert len(err.warnings) == 1
+    assert err.warnings[0]["line"] == 2
+    assert err.warnings[0]["column"] == 6
+
+def test_filter_ascii():
+    "Tests that everything but standard ASCII is replaced"
+
+    from validator.textfilter import filter_ascii
+    assert filter_ascii("a\x01b\tc\xe9\n") == "a?b\tc?\n"
+    assert filter_ascii(u"a\x7fb\r\u2603") == u"a?b\r?"
+    assert filter_ascii(["\x00", u"ok"]) == ["?", u"ok"]
@@ -223,3 +223,34 @@ def test_notice_friendly():
     
     assert output.count("foobar")
 
+
+def test_lazy_context():
+    "Tests that contexts are only rendered when they're output."
+
+    class Generator(object):
+        calls = 0
+        def get_context(self, line=1, column=0):
+            self.calls += 1
+            return ("before", "line %d" % line, "after")
+
+    generator = Generator()
+    bundle = ErrorBundle()
+    bundle.warning((), "warning", "description", "file.js", line=3,
+                   context=generator)
+    bundle.push_state("sub.xpi")
+    bundle.error((), "error", "description", "file.js", line=5,
+                 context=generator)
+    bundle.pop_state()
+    assert generator.calls == 0
+
+    results = json.loads(bundle.render_json())
+    assert generator.calls == 2
+    contexts = [message["context"] for message in results["messages"]]
+    assert ["before", "line 5", "after"] in contexts
+    assert ["before", "line 3", "after"] in contexts
+
+    # Contexts are only rendered once.
+    bundle.print_summary(verbose=True)
+    assert generator.calls == 2
+    assert bundle.get_context(bundle.warnings[0]) == \
+        ("before", "line 3", "after")
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from nose.tools import raises
+
+from validator.testcases import hashdb
+
+def _digests(count):
+    return [hashlib.sha1(str(i)).hexdigest() for i in range(count)]
+
+def _build(digests, bloom=True):
+    "Builds a database in a temporary directory and opens it."
+
+    path = tempfile.mkdtemp()
+    try:
+        database = os.path.join(path, "hashes.db")
+        hashdb.build(digests, database, bloom=bloom)
+        return hashdb.HashDatabase(database)
+    finally:
+        shutil.rmtree(path)
+
+def test_lookup():
+    "Tests that every stored hash is found and others aren't."
+
+    digests = _digests(1000)
+    for bloom in (True, False):
+        database = _build(digests[:500] + digests[:500], bloom=bloom)
+        assert len(database) == 500
+        assert all(digest in database for digest in digests[:500])
+        assert not any(digest in database for digest in digests[500:])
+
+        # Raw digests work as well as hex ones.
+        assert hashlib.sha1("0").digest() in database
+        assert "not a hash" not in database
+        assert "z" * 40 not in database
+        database.close()
+
+def test_sizes():
+    "Tests that sizes are only ruled out if every size is known."
+
+    digests = _digests(3)
+    database = _build(zip(digests, (10, 30, 20)))
+    assert all(digest in database for digest in digests)
+    assert all(database.may_contain_size(size) for size in (10, 20, 30))
+    assert not database.may_contain_size(15)
+    assert not database.may_contain_size(40)
+    assert database.may_contain_size(None)
+    database.close()
+
+    database = _build([(digests[0], 10), (digests[1], None)])
+    assert database.may_contain_size(15)
+    database.close()
+
+    database = _build(digests)
+    assert database.may_contain_size(15)
+    database.close()
+
+def test_empty():
+    "Tests that an empty database can be searched."
+
+    database = _build([])
+    assert len(database) == 0
+    assert _digests(1)[0] not in database
+
+@raises(ValueError)
+def test_bad_magic():
+    "Tests that files that aren't hash databases are refused."
+
+    handle, path = tempfile.mkstemp()
+    os.write(handle, "x" * 100)
+    os.close(handle)
+    try:
+        hashdb.HashDatabase(path)
+    finally:
+        os.remove(path)
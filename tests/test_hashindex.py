@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+from validator.testcases import hashindex
+
+def _make_index(lines):
+    "Builds a hash index from a list of definition lines."
+
+    handle, path = tempfile.mkstemp()
+    definitions = os.fdopen(handle, "w")
+    definitions.write("\n".join(lines) + "\n")
+    definitions.close()
+    try:
+        return hashindex.HashIndex(path)
+    finally:
+        os.remove(path)
+
+def test_unsized():
+    "Tests that an index without sizes can't rule out any size."
+
+    index = _make_index(["abc", "def", ""])
+    assert len(index) == 2
+    assert "abc" in index
+    assert "ghi" not in index
+    assert index.may_contain_size(123)
+
+def test_sized():
+    "Tests that an index with sizes rules out other sizes."
+
+    index = _make_index(["abc 10", "def 20"])
+    assert "def" in index
+    assert index.may_contain_size(10)
+    assert not index.may_contain_size(15)
+    assert index.may_contain_size(None)
+
+def test_get_index():
+    "Tests that the bundled definition files are only loaded once."
+
+    index = hashindex.get_index("hashes.txt")
+    assert index is hashindex.get_index("hashes.txt")
+    assert isinstance(index.hashes, frozenset)
+    assert len(index)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+import validator.testcases.scripting as scripting
+from validator.errorbundler import ErrorBundle
+from validator.testcases.javascript.astcache import ASTCache
+
+PROGRAM = {"type": "Program", "body": []}
+
+def test_roundtrip():
+    "Tests that ASTs can be stored and retrieved."
+
+    path = tempfile.mkdtemp()
+    try:
+        cache = ASTCache(path)
+        key = cache.key('"foo();"', "/usr/bin/js")
+        assert cache.get(key) is None
+        cache.set(key, PROGRAM)
+        assert cache.get(key) == PROGRAM
+
+        # A different shell must not see the same entry.
+        assert cache.key('"foo();"', "/usr/local/bin/js") != key
+    finally:
+        shutil.rmtree(path)
+
+def test_eviction():
+    "Tests that the least recently used entries are evicted."
+
+    path = tempfile.mkdtemp()
+    try:
+        cache = ASTCache(path, max_size=200)
+        keys = [cache.key('"%d"' % i, "js") for i in range(10)]
+        for i, key in enumerate(keys):
+            cache.set(key, {"type": "Program", "body": [], "id": i})
+            # Make sure that each entry gets a distinct timestamp.
+            entry = cache._entry_path(key)
+            os.utime(entry, (i, i))
+
+        assert cache.size <= 200
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[-1]) is not None
+    finally:
+        shutil.rmtree(path)
+
+def test_warm_cache_skips_shell():
+    "Tests that a cached AST is used without running the shell."
+
+    path = tempfile.mkdtemp()
+    try:
+        cache = ASTCache(path)
+        err = ErrorBundle()
+        err.save_resource("AST_CACHE", cache)
+
+        code = scripting._prepare_code("foo.js", u"foo();")
+        cache.set(cache.key(code, "/nonexistent/js"), PROGRAM)
+
+        tree = scripting._get_tree("foo.js", u"foo();",
+                                   shell="/nonexistent/js",
+                                   errorbundle=err)
+        assert tree == PROGRAM
+    finally:
+        shutil.rmtree(path)
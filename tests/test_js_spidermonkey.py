@@ -0,0 +1,222 @@
+import os
+import signal
+
+import validator.testcases.scripting as scripting
+import validator.testcases.javascript.spidermonkey as spidermonkey
+from validator.errorbundler import ErrorBundle
+
+FAKE_SHELL = "tests/resources/spidermonkey/fakeshell.py"
+
+def test_worker_parse():
+    "Tests that a worker can answer several requests in a row."
+
+    worker = spidermonkey.SpiderMonkeyWorker(FAKE_SHELL)
+    process = worker.process
+    for i in range(3):
+        assert worker.parse('"var x = %d;"' % i)["type"] == "Program"
+
+    # The same process should have answered every request.
+    assert worker.process is process
+    assert worker.ping()
+    worker.stop()
+    assert not worker.is_alive()
+
+def test_worker_restart():
+    "Tests that a crashed worker is restarted for the next request."
+
+    worker = spidermonkey.SpiderMonkeyWorker(FAKE_SHELL)
+    assert worker.parse('"crash"')["error"] == spidermonkey.CRASHED
+
+    assert worker.parse('"foo();"')["type"] == "Program"
+    worker.stop()
+
+def test_worker_timeout():
+    "Tests that a shell that stops answering is replaced."
+
+    worker = spidermonkey.SpiderMonkeyWorker(FAKE_SHELL, timeout=0.5)
+    process = worker.process
+    assert worker.parse('"hang"')["error"] == spidermonkey.TIMED_OUT
+    assert worker.process is not process
+    assert worker.parse('"foo();"')["type"] == "Program"
+    worker.stop()
+
+def test_pool_ping():
+    "Tests that idle workers that don't answer a ping are replaced."
+
+    ping_timeout = spidermonkey.PING_TIMEOUT
+    spidermonkey.PING_TIMEOUT = 0.5
+    pool = spidermonkey.SpiderMonkeyPool(FAKE_SHELL, size=1)
+    try:
+        worker = pool.acquire()
+        pool.release(worker)
+        process = worker.process
+
+        # A stopped process is still running, but won't answer.
+        os.kill(process.pid, signal.SIGSTOP)
+        worker.last_used = 0
+        assert pool.acquire() is worker
+        assert worker.process is not process
+        assert worker.parse('"foo();"')["type"] == "Program"
+        pool.release(worker)
+    finally:
+        spidermonkey.PING_TIMEOUT = ping_timeout
+        pool.close()
+
+def test_worker_garbage():
+    "Tests that unreadable output is reported as an error."
+
+    worker = spidermonkey.SpiderMonkeyWorker(FAKE_SHELL)
+    assert "error" in worker.parse('"broken"')
+    assert worker.parse('"foo();"')["type"] == "Program"
+    worker.stop()
+
+def test_pool_reuse():
+    "Tests that the pool hands the same worker back out."
+
+    pool = spidermonkey.SpiderMonkeyPool(FAKE_SHELL, size=1)
+    worker = pool.acquire()
+    pool.release(worker)
+    assert pool.acquire() is worker
+    pool.release(worker)
+
+    assert pool.parse('"foo();"')["type"] == "Program"
+    assert pool.running == 1
+
+    worker.stop()
+    pool.check()
+    assert worker.is_alive()
+    pool.close()
+    assert pool.running == 0
+
+def test_get_pool():
+    "Tests that pools are shared per shell."
+
+    pool = spidermonkey.get_pool(FAKE_SHELL)
+    assert spidermonkey.get_pool(FAKE_SHELL) is pool
+    spidermonkey.close_pools()
+    assert spidermonkey.get_pool(FAKE_SHELL) is not pool
+
+def test_pool_batch():
+    "Tests that a batch of sources is parsed in a single request."
+
+    pool = spidermonkey.SpiderMonkeyPool(FAKE_SHELL, size=1)
+    trees = pool.parse_batch({0: '"foo();"', 1: '"bar();"'})
+    assert sorted(trees.keys()) == ["0", "1"]
+    assert trees["1"]["type"] == "Program"
+    pool.close()
+
+def _batch_messages(files, batched):
+    """Tests JS files at tier 2, in a batch or not, and returns their
+    messages."""
+
+    err = ErrorBundle()
+    err.save_resource("SPIDERMONKEY", FAKE_SHELL)
+    err.tier = 2
+    if batched:
+        scripting.begin_batch(err, files)
+    for filename, data in files:
+        scripting.test_js_file(err, filename, data)
+    if batched:
+        scripting.end_batch(err)
+    assert err.tier == 2
+
+    messages = []
+    for message in err.warnings:
+        message = dict(message)
+        del message["uid"]
+        del message["context"]
+        messages.append(message)
+    return messages
+
+def test_scripting_batch():
+    "Tests that batched JS gives the same messages as JS parsed alone."
+
+    installation = scripting.SPIDERMONKEY_INSTALLATION
+    scripting.SPIDERMONKEY_INSTALLATION = FAKE_SHELL
+    try:
+        files = [("a.js", u"foo(\x01);\nnetwork.http = 1;"),
+                 ("empty.js", u""),
+                 ("b.js", u"bar(\x02);\ngeneral.useragent = 1;")]
+        messages = _batch_messages(files, False)
+        assert [(m["file"], m["id"][2], m["tier"]) for m in messages] == \
+               [("a.js", "control_char_filter", 4),
+                ("a.js", "compiled_error", 4),
+                ("b.js", "control_char_filter", 4),
+                ("b.js", "compiled_error", 4)]
+        assert _batch_messages(files, True) == messages
+
+        # JS that isn't part of the batch is parsed on its own.
+        err = ErrorBundle()
+        err.save_resource("SPIDERMONKEY", FAKE_SHELL)
+        scripting.begin_batch(err, [("foo.js", "foo();")])
+        scripting.test_js_snippet(err, "bar();", "foo.xul", 3)
+        scripting.test_js_file(err, "foo.js", "other();")
+        scripting.end_batch(err)
+        assert not err.get_resource("js_batch")
+        assert not err.failed()
+    finally:
+        scripting.SPIDERMONKEY_INSTALLATION = installation
+        spidermonkey.close_pools()
+
+def test_scripting_batch_split():
+    "Tests that large batches are parsed in several requests."
+
+    requests = []
+    installation = scripting.SPIDERMONKEY_INSTALLATION
+    max_files = scripting.MAX_BATCH_FILES
+    max_size = scripting.MAX_BATCH_SIZE
+    parse_batch = spidermonkey.SpiderMonkeyPool.parse_batch
+    def counting_parse_batch(self, sources):
+        requests.append(sorted(sources))
+        return parse_batch(self, sources)
+
+    scripting.SPIDERMONKEY_INSTALLATION = FAKE_SHELL
+    scripting.MAX_BATCH_FILES = 3
+    scripting.MAX_BATCH_SIZE = 100
+    spidermonkey.SpiderMonkeyPool.parse_batch = counting_parse_batch
+    try:
+        files = [("%d.js" % index, "foo();") for index in range(7)]
+        files += [("big.js", "x" * 200),
+                  ("last.js", "foo();"),
+                  ("after.js", "foo();")]
+        err = ErrorBundle()
+        err.save_resource("SPIDERMONKEY", FAKE_SHELL)
+        scripting.begin_batch(err, files)
+        for filename, data in files:
+            scripting.test_js_file(err, filename, data)
+        scripting.end_batch(err)
+        assert not err.failed()
+
+        # big.js is over the size limit, so it's parsed on its own, and
+        # 6.js is left alone ahead of it.
+        assert requests == [[0, 1, 2], [3, 4, 5], [8, 9]]
+    finally:
+        scripting.SPIDERMONKEY_INSTALLATION = installation
+        scripting.MAX_BATCH_FILES = max_files
+        scripting.MAX_BATCH_SIZE = max_size
+        spidermonkey.SpiderMonkeyPool.parse_batch = parse_batch
+        spidermonkey.close_pools()
+
+def test_scripting_crash():
+    "Tests that a file that crashes the shell doesn't end the validation."
+
+    installation = scripting.SPIDERMONKEY_INSTALLATION
+    scripting.SPIDERMONKEY_INSTALLATION = FAKE_SHELL
+    try:
+        err = ErrorBundle()
+        err.save_resource("SPIDERMONKEY", FAKE_SHELL)
+        scripting.test_js_file(err, "a.js", "crash();")
+        assert [w["id"][2] for w in err.warnings] == ["retrieving_tree"]
+
+        # In a batch, the other files are still parsed.
+        err = ErrorBundle()
+        err.save_resource("SPIDERMONKEY", FAKE_SHELL)
+        scripting.begin_batch(err, [("a.js", "crash();"),
+                                    ("b.js", "foo();")])
+        scripting.test_js_file(err, "a.js", "crash();")
+        scripting.test_js_file(err, "b.js", "foo();")
+        scripting.end_batch(err)
+        assert [w["file"] for w in err.warnings] == ["a.js"]
+    finally:
+        scripting.SPIDERMONKEY_INSTALLATION = installation
+        spidermonkey.close_pools()
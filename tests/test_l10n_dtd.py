@@ -58,3 +58,25 @@ def _inspect_file_results(parser):
     assert "line" in parser.entities
     assert parser.entities["line"] == "woot"
     
+def test_lines_and_comments():
+    """Tests that entities are recorded with the line they start on, that
+    values may span lines, and that commented entities are skipped."""
+    
+    parser = dtd.DTDParser(StringIO("""<!-- <!ENTITY hidden "no"> -->
+<!ENTITY first "one two">
+<!--
+<!ENTITY hidden 'no'>
+-->
+<!ENTITY % param SYSTEM "foo.dtd">
+<!ENTITY external SYSTEM "foo.xml">
+<!ENTITY
+    multi 'spans
+lines with a " quote'
+>
+<!ENTITY last "it's >">"""))
+    
+    assert parser.items == [("first", "one two", 2),
+                            ("multi", 'spans\nlines with a " quote', 8),
+                            ("last", "it's >", 12)]
+    assert "hidden" not in parser.entities
+    
@@ -1,3 +1,5 @@
+import json
+
 import validator.testcases.l10ncompleteness as l10n
 from validator.testcases.l10n.dtd import DTDParser
 from validator.testcases.l10n.properties import PropertiesParser
@@ -113,3 +115,68 @@ def _compare_packs(reference, target):
     print comparison
     return count
 
+def test_reference_locale():
+    "Tests that a parsed reference can be compared against many targets."
+    
+    ref = XPIManager("tests/resources/l10n/langpack/reference.jar")
+    reference = l10n.ReferenceLocale(ref)
+    names = [name for name, document in reference.documents]
+    assert names == sorted(names)
+    assert names
+    
+    # The reference isn't read again once it has been parsed.
+    ref.read = None
+    ref.get_file_data = None
+    for target in ("pass.jar", "missing_file.jar", "extra_files.jar",
+                   "missing_file_entities.jar", "missing_entities.jar"):
+        target = XPIManager("tests/resources/l10n/langpack/%s" % target)
+        expected = l10n._compare_packages(
+                XPIManager("tests/resources/l10n/langpack/reference.jar"),
+                target)
+        assert l10n._compare_packages(reference, target) == expected
+
+def _test_lp_xpi():
+    "Tests the bundled Firefox language pack against itself."
+    
+    package = XPIManager("validator/testcases/langpacks/firefox.xpi")
+    err = ErrorBundle()
+    err.save_resource("supports", ["firefox"])
+    l10n.test_lp_xpi(err, package.get_file_data(), package)
+    return [(message["id"], message["file"], message["description"]) for
+            message in err.warnings + err.notices]
+
+def test_langpack_index():
+    "Tests that the prebuilt index gives the same results as the packages."
+    
+    index_data = l10n.LANGPACK_INDEX_DATA
+    packs = l10n.REFERENCE_PACKS.copy()
+    try:
+        l10n.REFERENCE_PACKS.clear()
+        l10n.LANGPACK_INDEX_DATA = None
+        index = l10n._load_langpack_index()
+        assert "firefox" in index
+        indexed = _test_lp_xpi()
+        assert indexed
+        
+        # Without an index, the packages are parsed instead.
+        l10n.REFERENCE_PACKS.clear()
+        l10n.LANGPACK_INDEX_DATA = {}
+        assert _test_lp_xpi() == indexed
+
+        # So are they if the index was built by other parsers.
+        l10n.REFERENCE_PACKS.clear()
+        l10n.LANGPACK_INDEX_DATA = {"firefox": dict(index["firefox"],
+                                                    version=0,
+                                                    documents=[])}
+        assert _test_lp_xpi() == indexed
+        
+        fresh = l10n.index_reference_pack(
+                "validator/testcases/langpacks/firefox.xpi")
+        # The index stores lists in place of tuples.
+        fresh = json.loads(json.dumps(fresh, encoding="latin-1"))
+        assert index["firefox"] == l10n._from_json(fresh)
+    finally:
+        l10n.LANGPACK_INDEX_DATA = index_data
+        l10n.REFERENCE_PACKS.clear()
+        l10n.REFERENCE_PACKS.update(packs)
+
@@ -0,0 +1,40 @@
+import re
+
+from validator.testcases.regexrules import RuleSet
+
+def _first_matches(rules, data):
+    "Returns the first match of each rule, found one rule at a time."
+
+    output = []
+    for pattern, rule in rules.rules:
+        match = pattern.search(data)
+        if match:
+            output.append((rule, match.start(), match.group()))
+    return output
+
+def test_first_matches():
+    "Tests that the combined scan finds the first match of each rule."
+
+    rules = RuleSet(re.I)
+    rules.register("ab+", "ab")
+    rules.register("b", "b")
+    rules.register("<(script|embed)", "tag")
+    rules.register("nowhere", "nowhere")
+
+    for data in ("", "xyz", "abbb b", "b ab", "<SCRIPT abb <embed",
+                 "zz<embed b a"):
+        matches = [(rule, match.start(), match.group()) for
+                   rule, match in rules.first_matches(data)]
+        assert matches == _first_matches(rules, data), data
+
+def test_shadowed_rules():
+    "Tests that rules that overlap an earlier match are still found."
+
+    rules = RuleSet()
+    rules.register("network\\.http\\.foo", "long")
+    rules.register("network\\.http", "short")
+    rules.register("http", "inner")
+
+    matches = rules.first_matches("x network.http.foo")
+    assert [(rule, match.start()) for rule, match in matches] == \
+        [("long", 2), ("short", 2), ("inner", 10)]
@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+
+import validator.constants
+import validator.resultcache as resultcache
+import validator.submain
+from validator.testcases import hashindex
+from validator.validate import validate
+from validator.constants import PACKAGE_ANY, PACKAGE_THEME
+
+PACKAGE = "tests/resources/xpi/install_rdf_only.xpi"
+APPS = "validator/app_versions.json"
+
+def _test_cache(cache):
+    "Tests the basic operations of a cache."
+
+    assert cache.get("abcdef") is None
+    cache.set("abcdef", '{"foo": "bar"}')
+    assert cache.get("abcdef") == '{"foo": "bar"}'
+    cache.set("abcdef", '{"foo": "baz"}')
+    assert cache.get("abcdef") == '{"foo": "baz"}'
+
+    # Expired entries are never returned.
+    cache.ttl = -1
+    assert cache.get("abcdef") is None
+
+def test_directory():
+    "Tests the directory-backed result cache."
+
+    path = tempfile.mkdtemp()
+    try:
+        _test_cache(resultcache.DirectoryResultCache(path))
+    finally:
+        shutil.rmtree(path)
+
+def test_sqlite():
+    "Tests the SQLite-backed result cache."
+
+    path = tempfile.mkdtemp()
+    try:
+        _test_cache(resultcache.SQLiteResultCache(
+                            os.path.join(path, "results.db")))
+    finally:
+        shutil.rmtree(path)
+
+def test_sqlite_eviction():
+    "Tests that the least recently used results are evicted."
+
+    path = tempfile.mkdtemp()
+    try:
+        cache = resultcache.SQLiteResultCache(os.path.join(path,
+                                                           "results.db"),
+                                              max_size=100)
+        for i in range(10):
+            cache.set("key%d" % i, "x" * 20)
+        assert cache.get("key0") is None
+        assert cache.get("key9") is not None
+    finally:
+        shutil.rmtree(path)
+
+def test_package_key():
+    "Tests that the options affect the package key."
+
+    key = resultcache.package_key(PACKAGE, APPS, True, True, PACKAGE_ANY)
+    assert key == resultcache.package_key(PACKAGE, APPS, True, True,
+                                          PACKAGE_ANY)
+    assert key != resultcache.package_key(PACKAGE, APPS, False, True,
+                                          PACKAGE_ANY)
+    assert key != resultcache.package_key(PACKAGE, APPS, True, True,
+                                          PACKAGE_THEME)
+
+def test_package_key_shell():
+    "Tests that the Spidermonkey shell affects the package key."
+
+    installation = validator.constants.SPIDERMONKEY_INSTALLATION
+    validator.constants.SPIDERMONKEY_INSTALLATION = APPS
+    try:
+        key = resultcache.package_key(PACKAGE, APPS, True, True,
+                                      PACKAGE_ANY)
+        assert key == resultcache.package_key(PACKAGE, APPS, True, True,
+                                              PACKAGE_ANY, APPS)
+        assert key != resultcache.package_key(PACKAGE, APPS, True, True,
+                                              PACKAGE_ANY, None)
+        assert key != resultcache.package_key(PACKAGE, APPS, True, True,
+                                              PACKAGE_ANY, PACKAGE)
+
+        # Without an installation, no JS is parsed whatever the option.
+        validator.constants.SPIDERMONKEY_INSTALLATION = None
+        assert resultcache.package_key(PACKAGE, APPS, True, True,
+                                       PACKAGE_ANY, PACKAGE) == \
+               resultcache.package_key(PACKAGE, APPS, True, True,
+                                       PACKAGE_ANY, None)
+    finally:
+        validator.constants.SPIDERMONKEY_INSTALLATION = installation
+
+def test_package_key_definitions():
+    "Tests that the data files that the tests go by affect the package key."
+
+    path = tempfile.mkdtemp()
+    definitions = hashindex.DEFINITIONS
+    digest = resultcache.DEFINITIONS_DIGEST
+    try:
+        for name in ("hashes.txt", "whitelist_hashes.txt"):
+            shutil.copy(os.path.join(definitions, name), path)
+        hashindex.DEFINITIONS = path
+        resultcache.DEFINITIONS_DIGEST = None
+        key = resultcache.package_key(PACKAGE, APPS, True, True, PACKAGE_ANY)
+
+        # The digest is only taken once per process.
+        whitelist = open(os.path.join(path, "whitelist_hashes.txt"), "a")
+        whitelist.write("%s\n" % ("0" * 40))
+        whitelist.close()
+        assert key == resultcache.package_key(PACKAGE, APPS, True, True,
+                                              PACKAGE_ANY)
+
+        resultcache.DEFINITIONS_DIGEST = None
+        assert key != resultcache.package_key(PACKAGE, APPS, True, True,
+                                              PACKAGE_ANY)
+    finally:
+        hashindex.DEFINITIONS = definitions
+        resultcache.DEFINITIONS_DIGEST = digest
+        shutil.rmtree(path)
+
+def test_validate_cached():
+    "Tests that validate() stores results and serves them from the cache."
+
+    path = tempfile.mkdtemp()
+    prepare_package = validator.submain.prepare_package
+    validator.submain.prepare_package = \
+            lambda err, path, expectation, filename, data: \
+                    err.error(("foo", ), "Foo")
+    try:
+        cache = resultcache.DirectoryResultCache(path)
+        output = validate(PACKAGE, result_cache=cache)
+        key = resultcache.package_key(PACKAGE, APPS, True, True, PACKAGE_ANY)
+        assert cache.get(key) == output
+
+        cache.set(key, "cached")
+        assert validate(PACKAGE, result_cache=cache) == "cached"
+        assert validate(PACKAGE, result_cache=cache, listed=False) != \
+                "cached"
+    finally:
+        validator.submain.prepare_package = prepare_package
+        shutil.rmtree(path)
+
+def test_validate_shell_failure():
+    "Tests that results with a failure of the JS shell aren't cached."
+
+    path = tempfile.mkdtemp()
+    prepare_package = validator.submain.prepare_package
+    validator.submain.prepare_package = \
+            lambda err, path, expectation, filename, data: \
+                    err.warning(("testcases_scripting",
+                                 "test_js_file",
+                                 "retrieving_tree"),
+                                "JS reflection error prevented validation",
+                                ["An error in the JavaScript file prevented "
+                                 "it from being properly read by the "
+                                 "Spidermonkey JS engine.",
+                                 "'Spidermonkey shell crashed while "
+                                 "parsing.'"],
+                                filename="foo.js")
+    try:
+        cache = resultcache.DirectoryResultCache(path)
+        validate(PACKAGE, result_cache=cache)
+        key = resultcache.package_key(PACKAGE, APPS, True, True, PACKAGE_ANY)
+        assert cache.get(key) is None
+    finally:
+        validator.submain.prepare_package = prepare_package
+        shutil.rmtree(path)
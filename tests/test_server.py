@@ -0,0 +1,113 @@
+import httplib
+import json
+import threading
+import time
+
+from validator import server
+
+def _start(max_pending):
+    "Starts a server on a free port and returns it."
+
+    dispatcher = server.Dispatcher(1, max_pending=max_pending)
+    httpd = server.ValidationServer(("127.0.0.1", 0), dispatcher)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return httpd
+
+def _stop(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+    httpd.dispatcher.close()
+
+def _request(httpd, method, url, body=None):
+    connection = httpd.server_address
+    connection = httplib.HTTPConnection(*connection)
+    try:
+        connection.request(method, url, body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def test_status():
+    "Tests that the server reports its load."
+
+    httpd = _start(4)
+    try:
+        status, body = _request(httpd, "GET", "/status")
+        assert status == 200
+        assert body["pending"] == 0
+        assert body["max_pending"] == 4
+
+        assert _request(httpd, "GET", "/nothing")[0] == 404
+    finally:
+        _stop(httpd)
+
+def test_bad_requests():
+    "Tests that malformed validation requests are refused."
+
+    httpd = _start(4)
+    try:
+        assert _request(httpd, "POST", "/validate")[0] == 400
+        assert _request(httpd, "POST", "/validate?path=x&type=foo")[0] == 400
+    finally:
+        _stop(httpd)
+
+def test_backpressure():
+    "Tests that requests past the limit are turned away."
+
+    httpd = _start(1)
+    try:
+        assert httpd.dispatcher.reserve()
+        status, body = _request(httpd, "POST", "/validate", "PK")
+        assert status == 503
+
+        httpd.dispatcher.release()
+        assert httpd.dispatcher.pending == 0
+    finally:
+        _stop(httpd)
+
+def test_upload():
+    "Tests that uploads are validated in memory, under their file name."
+
+    def fake_validate(path, format, **options):
+        return json.dumps({"path": path,
+                           "data": options["data"],
+                           "filename": options["filename"]})
+
+    # The workers are forked with the fake in place.
+    validate = server.validate
+    server.validate = fake_validate
+    try:
+        httpd = _start(1)
+    finally:
+        server.validate = validate
+    try:
+        status, body = _request(httpd, "POST",
+                                "/validate?filename=dir/addon.xpi", "PK")
+        assert status == 200
+        assert body == {"path": None, "data": "PK", "filename": "addon.xpi"}
+    finally:
+        _stop(httpd)
+
+def test_run_validation_timeout():
+    "Tests that a validation that takes too long gets a 504."
+
+    def slow_validate(path, format, **options):
+        try:
+            time.sleep(5)
+        except Exception:
+            pass
+        return json.dumps({"success": True})
+
+    validate = server.validate
+    server.validate = slow_validate
+    try:
+        start = time.time()
+        status, body = server.run_validation(("slow.xpi", {}, 1))
+        assert time.time() - start < 4
+        assert status == 504
+        assert "timed out" in json.loads(body)["error"]
+    finally:
+        server.validate = validate
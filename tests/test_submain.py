@@ -49,6 +49,45 @@ def test_prepare_package_xml():
     assert err.failed()
     assert not err.reject # prepare_package has no authority to reject XML.
 
+def test_prepare_package_memory():
+    "Tests that packages can be passed as data or as file objects"
+    
+    calls = []
+    tp = submain.test_package
+    ts = submain.test_search
+    submain.test_package = lambda err, file_, name, expectation: \
+            calls.append((file_.read(), name))
+    submain.test_search = lambda err, package, expectation: \
+            calls.append((package.read(), "search"))
+    try:
+        data = open("tests/resources/main/foo.xpi", "rb").read()
+
+        err = ErrorBundle(None, True)
+        submain.prepare_package(err, data=data, filename="foo.xpi")
+        submain.prepare_package(err, data=buffer(data), filename="foo.xpi")
+        submain.prepare_package(err, open("tests/resources/main/foo.xpi",
+                                          "rb"))
+        submain.prepare_package(err, data="<xml/>", filename="foo.xml")
+
+        # A path is always a path; the file name is only a hint.
+        submain.prepare_package(err, "tests/resources/main/foo.xpi",
+                                filename="bar.jar")
+        assert not err.failed()
+
+        assert calls == [(data, "foo.xpi"),
+                         (data, "foo.xpi"),
+                         (data, "tests/resources/main/foo.xpi"),
+                         ("<xml/>", "search"),
+                         (data, "bar.jar")]
+
+        # Data without a name can't be recognized.
+        submain.prepare_package(err, data=bytearray(data))
+        assert err.failed()
+        assert err.reject
+    finally:
+        submain.test_package = tp
+        submain.test_search = ts
+
 
 # Test the function of the decorator iterator
 
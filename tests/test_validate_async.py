@@ -0,0 +1,56 @@
+import json
+import threading
+
+import validator.submain
+from validator.validate import validate_async
+import validator.testcases.javascript.spidermonkey as spidermonkey
+
+PACKAGE = "tests/resources/xpi/install_rdf_only.xpi"
+
+def test_validate_async():
+    "Tests that validations can be run in the background."
+
+    started = []
+    release = threading.Event()
+
+    def prepare_package(err, path, expectation, filename, data):
+        started.append(path)
+        release.wait(30)
+        err.error(("foo", ), "Foo")
+
+    original = validator.submain.prepare_package
+    validator.submain.prepare_package = prepare_package
+    try:
+        results = []
+        pending = [validate_async(PACKAGE, callback=results.append)
+                   for i in range(3)]
+
+        # Every validation is running at the same time.
+        for i in range(100):
+            if len(started) == 3:
+                break
+            threading.Event().wait(0.1)
+        assert len(started) == 3
+        assert not any(result.ready() for result in pending)
+
+        release.set()
+        outputs = [result.get(30) for result in pending]
+    finally:
+        validator.submain.prepare_package = original
+
+    assert sorted(results) == sorted(outputs)
+    for output in outputs:
+        assert json.loads(output)["errors"] == 1
+
+def test_set_pool_size():
+    "Tests that the number of shells per pool can be changed."
+
+    size = spidermonkey.POOL_SIZE
+    try:
+        pool = spidermonkey.get_pool("tests/nonexistent/js")
+        spidermonkey.set_pool_size(2)
+        assert pool.size == 2
+        assert spidermonkey.get_pool("tests/other/js").size == 2
+    finally:
+        spidermonkey.set_pool_size(size)
+        spidermonkey.close_pools()
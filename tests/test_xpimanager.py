@@ -1,3 +1,4 @@
+import hashlib
 import zipfile
 from zipfile import ZipFile
 
@@ -39,3 +40,25 @@ def test_missing_file():
     
     x = XPIManager("tests/resources/foo.bar")
     assert not x.zf
+
+def test_member_store():
+    "Tests that members are decompressed once and kept for later reads."
+    
+    z = XPIManager("tests/resources/xpi/install_rdf_only.xpi")
+    assert z.test() == False
+    assert "install.rdf" in z.contents
+    
+    data = z.read("install.rdf")
+    assert z.read("install.rdf") is data
+    assert z.read_head("install.rdf", 4) == data[:4]
+    assert z.get_hash("install.rdf") == hashlib.sha1(data).hexdigest()
+
+def test_member_store_spill():
+    "Tests that members past the memory ceiling are spilled to disk."
+    
+    z = XPIManager("tests/resources/xpi/install_rdf_only.xpi", max_memory=0)
+    data = z.read("install.rdf")
+    assert "install.rdf" not in z.contents
+    assert "install.rdf" in z.spilled
+    assert z.read("install.rdf") == data
+    assert z.read_head("install.rdf", 4) == data[:4]
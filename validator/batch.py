@@ -0,0 +1,163 @@
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import traceback
+
+from validator import workerpool
+from validator.validate import validate
+from validator.testcases.javascript import spidermonkey
+
+# The extensions of the files that are picked up from directories.
+PACKAGE_EXTENSIONS = (".xpi", ".jar", ".xml")
+
+# The number of packages that a worker process validates before it is
+# replaced. Module-level caches only ever grow, so workers are recycled to
+# keep their memory in check.
+MAX_TASKS_PER_CHILD = 50
+
+
+class JobTimeout(BaseException):
+    """Raised when a package takes too long to validate. It isn't an
+    Exception, so that the tests' catch-all handlers let it through."""
+
+
+def collect_paths(sources=(), manifest=None):
+    """Returns the list of packages to validate. Sources may be packages
+    or directories, which contribute every package below them. A manifest
+    is a file listing one path per line; blank lines and lines starting
+    with # are skipped."""
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in
+                             sorted(files) if
+                             name.lower().endswith(PACKAGE_EXTENSIONS))
+        else:
+            paths.append(source)
+
+    if manifest is not None:
+        manifest_file = open(manifest)
+        try:
+            for line in manifest_file:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+        finally:
+            manifest_file.close()
+
+    return paths
+
+
+def validate_one(path, **options):
+    """Validates a single package and returns its NDJSON line along with
+    whether it failed. Packages that can't be validated are reported on
+    the line rather than ending the batch."""
+
+    try:
+        output = validate(path, format="json", **options)
+    except Exception:
+        return (json.dumps({"path": path,
+                            "error": traceback.format_exc()}) + "\n",
+                True)
+
+    result = json.loads(output)
+    return (json.dumps({"path": path, "result": result}) + "\n",
+            not result["success"])
+
+
+def _timed_out(signum, frame):
+    raise JobTimeout()
+
+
+def call_with_timeout(timeout, function, *args, **kwargs):
+    """Calls a function and raises JobTimeout if it hasn't returned within
+    `timeout` seconds. This relies on SIGALRM, so it only works in the main
+    thread of a process; elsewhere (or if `timeout` is None) there is no
+    limit."""
+
+    timed = timeout and hasattr(signal, "SIGALRM") and \
+            isinstance(threading.current_thread(), threading._MainThread)
+    if timed:
+        previous = signal.signal(signal.SIGALRM, _timed_out)
+        signal.alarm(timeout)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if timed:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def run_job(job):
+    """Validates a package within a time limit. `job` is a tuple of the
+    path, the options for validate(), and the limit in seconds (or None).
+    Returns the same as validate_one()."""
+
+    path, options, timeout = job
+    try:
+        return call_with_timeout(timeout, validate_one, path, **options)
+    except JobTimeout:
+        # The shells may have been interrupted mid-parse, so they can't be
+        # trusted with the next package.
+        spidermonkey.close_pools()
+        return (json.dumps({"path": path,
+                            "error": "Validation timed out after %d "
+                                     "seconds." % timeout}) + "\n",
+                True)
+
+
+def _write_results(results, output):
+    "Writes each line of output as it arrives and counts the failures."
+
+    if output is None:
+        output = sys.stdout
+
+    failures = 0
+    for line, failed in results:
+        output.write(line)
+        output.flush()
+        if failed:
+            failures += 1
+    return failures
+
+
+def run_batch(paths, output=None, timeout=None, **options):
+    """Validates each package in turn in this process and writes one JSON
+    object per line to `output` (stdout by default). Returns the number of
+    packages that failed validation or could not be validated."""
+
+    return _write_results((run_job((path, options, timeout)) for
+                           path in paths),
+                          output)
+
+
+def run_parallel(paths, jobs, output=None, ordered=False, timeout=None,
+                 max_tasks=MAX_TASKS_PER_CHILD, **options):
+    """Like run_batch(), but validates the packages in a pool of `jobs`
+    worker processes. Results are written as soon as they are ready, or
+    in the order of `paths` if `ordered` is set."""
+
+    pool = multiprocessing.Pool(jobs,
+                                initializer=workerpool.init_worker,
+                                maxtasksperchild=max_tasks)
+    try:
+        jobs = ((path, options, timeout) for path in paths)
+        if ordered:
+            results = pool.imap(run_job, jobs)
+        else:
+            results = pool.imap_unordered(run_job, jobs)
+        failures = _write_results(results, output)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return failures
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+APPLICATION_LISTS = {}
+APPLICATION_LISTS_LOCK = threading.Lock()
+
+# The number of locale packages, and the number of bytes of them, that a
+# LocaleCache holds before it starts dropping the least recently used.
+MAX_LOCALE_ENTRIES = 32
+MAX_LOCALE_SIZE = 32 * 1024 * 1024
+
+
+class ValidationContext(object):
+    """The state of a single validation run. Every ErrorBundle carries one,
+    so validations that run side by side (in threads, for instance) don't
+    share anything that changes while they run.
+
+    approved_applications : The approved application versions, or None to
+                            fall back on
+                            targetapplication.APPROVED_APPLICATIONS. This
+                            is shared between runs and must not be changed.
+    debug : Whether the tests should print debugging output
+    locale_cache : The locale packages that have been opened (a
+                   LocaleCache)"""
+
+    def __init__(self, approved_applications=None, debug=False):
+        self.approved_applications = approved_applications
+        self.debug = debug
+        self.locale_cache = LocaleCache()
+
+
+class LocaleCache(object):
+    """A cache of opened locale packages that holds no more than
+    `max_entries` of them, or `max_size` bytes of them, dropping the least
+    recently used first. Keys should include the digest of the package, so
+    that packages with the same path in different add-ons are told apart.
+
+    hits, misses, and evictions count what the cache has done since it was
+    created; clearing the cache doesn't reset them."""
+
+    def __init__(self, max_entries=MAX_LOCALE_ENTRIES,
+                 max_size=MAX_LOCALE_SIZE):
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __reduce__(self):
+        # Worker processes start out with an empty cache.
+        return (self.__class__, (self.max_entries, self.max_size))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        "Returns the package stored for a key, or None if there isn't one."
+
+        self.lock.acquire()
+        try:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            # Move the entry to the most recently used end.
+            value, size = self.entries.pop(key)
+            self.entries[key] = (value, size)
+            self.hits += 1
+            return value
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, size=0):
+        """Stores a package of `size` bytes. Packages that are too large for
+        the cache on their own are not stored."""
+
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_size:
+                return
+
+            self.entries[key] = (value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or \
+                  self.size > self.max_size:
+                old_value, old_size = self.entries.popitem(last=False)[1]
+                self.size -= old_size
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        "Drops every package."
+
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        "Returns the counters and the current size of the cache."
+
+        return {"entries": len(self.entries),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+
+def get_context(err):
+    """Returns the context of a bundle. Stand-ins for bundles (like the
+    traverser's MockBundler) get a fresh default context."""
+
+    context = getattr(err, "context", None)
+    if context is None:
+        context = ValidationContext()
+    return context
+
+
+def load_approved_applications(path):
+    """Returns the approved application versions from a JSON file. Each
+    file is only parsed again if it has changed, and every caller gets the
+    same dict."""
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = None
+    key = (os.path.realpath(path), mtime)
+
+    APPLICATION_LISTS_LOCK.acquire()
+    try:
+        if key not in APPLICATION_LISTS:
+            applications = open(path)
+            try:
+                APPLICATION_LISTS[key] = json.load(applications)
+            finally:
+                applications.close()
+        return APPLICATION_LISTS[key]
+    finally:
+        APPLICATION_LISTS_LOCK.release()
@@ -1,18 +1,44 @@
 import os
+import re
+from bisect import bisect_left
 from StringIO import StringIO
 
 import textfilter
 
-class ContextGenerator:
+class ContextGenerator(object):
     """The context generator creates a line-by-line mapping of all files that
     are validated. It will then use that to help produce useful bits of code
-    for errors, warnings, and the like."""
+    for errors, warnings, and the like.
+    
+    Nothing is split or indexed until it is first needed, since most files
+    never produce a message."""
 
     def __init__(self, data=None):
         if isinstance(data, StringIO):
             data = data.getvalue()
         
-        self.data = data.split("\n")
+        self._raw = data
+        self._lines = None
+        self._line_ends = None
+
+    @property
+    def data(self):
+        "The lines of the file"
+
+        if self._lines is None:
+            self._lines = self._raw.split("\n")
+        return self._lines
+
+    @property
+    def line_ends(self):
+        """The position of the newline that ends each line (or, for the
+        last line, the length of the file)"""
+
+        if self._line_ends is None:
+            self._line_ends = [m.start() for m in
+                               re.finditer("\n", self._raw)]
+            self._line_ends.append(len(self._raw))
+        return self._line_ends
 
     def get_context(self, line=1, column=0):
         "Returns a tuple containing the context for a line"
@@ -44,16 +70,18 @@ class ContextGenerator:
     def get_line(self, position):
         "Returns the line number that the given string position is found on"
 
-        datalen = len(self.data)
-        count = len(self.data[0])
-        line = 1
-        while count < position:
-            if line >= datalen:
-                break
-            count += len(self.data[line]) + 1
-            line += 1
+        # A position on a newline belongs to the line that it ends, and
+        # positions past the end of the file belong to the last line.
+        ends = self.line_ends
+        return min(bisect_left(ends, position) + 1, len(ends))
+
+    def get_column(self, position):
+        "Returns the column that the given string position is found at"
 
-        return line
+        line = self.get_line(position)
+        if line == 1:
+            return position
+        return position - self.line_ends[line - 2] - 1
 
     def _format_line(self, line, column=0, rel_line=1):
         "Formats a line from the data to be the appropriate length"
@@ -86,3 +114,19 @@ class ContextGenerator:
         data = textfilter.filter_ascii(data)
         return data
 
+
+class ContextReference(object):
+    """Stands in for the context of a message until it is needed. Holds the
+    generator and the position, and renders the context on request."""
+
+    __slots__ = ("generator", "line", "column")
+
+    def __init__(self, generator, line=1, column=0):
+        self.generator = generator
+        self.line = line
+        self.column = column
+
+    def render(self):
+        "Returns the context tuple, as ContextGenerator.get_context() would"
+
+        return self.generator.get_context(line=self.line, column=self.column)
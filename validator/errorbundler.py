@@ -2,7 +2,8 @@ import json
 import uuid
 from StringIO import StringIO
 
-from contextgenerator import ContextGenerator
+from context import ValidationContext
+from contextgenerator import ContextGenerator, ContextReference
 from outputhandlers.shellcolors import OutputHandler
 from textfilter import filter_ascii
 
@@ -12,9 +13,10 @@ class ErrorBundle(object):
     'separating the sorrow and collecting up all the cream.' It's
     borderline magical."""
     
-    def __init__(self, determined=True, listed=True):
+    def __init__(self, determined=True, listed=True, context=None):
         
         self.handler = None
+        self.context = context or ValidationContext()
 
         self.errors = []
         self.warnings = []
@@ -98,16 +100,15 @@ class ErrorBundle(object):
         
         message["uid"] = uid
 
-        # Get the context for the message (if there's a context available)
-        if context is not None:
-            if isinstance(context, tuple):
-                message["context"] = context
-            else:
-                message["context"] = \
-                            context.get_context(line=message["line"],
-                                                column=message["column"])
+        # Keep a reference to the context for the message (if there's a
+        # context available). It is only rendered when the message is
+        # output; see get_context().
+        if context is None or isinstance(context, (tuple, ContextReference)):
+            message["context"] = context
         else:
-            message["context"] = None
+            message["context"] = ContextReference(context,
+                                                  line=message["line"],
+                                                  column=message["column"])
         
         message["message"] = filter_ascii(message["message"])
         message["description"] = filter_ascii(message["description"])
@@ -134,6 +135,21 @@ class ErrorBundle(object):
         
             tree[last_id]['__messages'].append(uid)
         
+    def get_context(self, message):
+        "Renders the context of a message (if it hasn't been) and returns it."
+        
+        context = message["context"]
+        if isinstance(context, ContextReference):
+            context = message["context"] = context.render()
+        return context
+        
+    def render_contexts(self):
+        "Renders the context of every message."
+        
+        for stack in (self.errors, self.warnings, self.notices):
+            for message in stack:
+                self.get_context(message)
+        
     def set_type(self, type_):
         "Stores the type of addon we're scanning"
         self.detected_type = type_
@@ -282,6 +298,7 @@ class ErrorBundle(object):
                   "metadata": self.metadata}
         
         messages = output["messages"]
+        self.render_contexts()
         
         # Copy messages to the JSON output
         for error in self.errors:
@@ -316,6 +333,7 @@ class ErrorBundle(object):
         
         buffer = StringIO()
         self.handler = OutputHandler(buffer, no_color)
+        self.render_contexts()
 
         # Make a neat little printout.
         self.handler.write("\n<<GREEN>>Summary:") \
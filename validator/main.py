@@ -5,12 +5,18 @@ import sys
 import zipfile
 from StringIO import StringIO
 
+from validator import batch
 from validator.validate import validate
 from constants import *
 
 def main():
     "Main function. Handles delegation to other functions."
     
+    # `addon-validator serve` runs the validation server instead.
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from validator import server
+        return server.main(sys.argv[2:])
+
     expectations = {"any":PACKAGE_ANY,
                     "extension":PACKAGE_EXTENSION,
                     "theme":PACKAGE_THEME,
@@ -24,7 +30,10 @@ def main():
         description="Run tests on a Mozilla-type addon.")
 
     parser.add_argument("package",
-                        help="The path of the package you're testing")
+                        nargs="*",
+                        help="""The path of the package you're testing. In
+                        batch mode, any number of packages or directories
+                        of packages may be given.""")
     parser.add_argument("-t",
                         "--type",
                         default="any",
@@ -63,6 +72,58 @@ def main():
                         default="validator/app_versions.json",
                         help="""A JSON file containing acceptable applications
                         and their versions""")
+    parser.add_argument("--ast-cache-dir",
+                        default=None,
+                        help="""A directory in which parsed JavaScript is
+                        cached between runs. Unchanged files will not need
+                        to be parsed again.""")
+    parser.add_argument("--result-cache",
+                        default=None,
+                        help="""A directory (or a SQLite database, if the
+                        path ends in .db) in which JSON results are cached.
+                        Packages that have been validated before with the
+                        same options are not validated again.""")
+    parser.add_argument("--file-cache",
+                        default=None,
+                        help="""A directory (or a SQLite database, if the
+                        path ends in .db) in which the messages of each file
+                        are cached. Files that have been seen before are
+                        not tested again.""")
+    parser.add_argument("--file-jobs",
+                        type=int,
+                        default=None,
+                        help="""The number of processes that the files of
+                        large packages are tested in. The results are the
+                        same as when they are tested one by one.""")
+    parser.add_argument("--batch",
+                        action="store_const",
+                        const=True,
+                        help="""Validate every given package in this one
+                        process and write one JSON result per line.""")
+    parser.add_argument("--manifest",
+                        default=None,
+                        help="""A file listing the packages to validate in
+                        batch mode, one path per line.""")
+    parser.add_argument("--batch-output",
+                        default=None,
+                        help="""The file that batch mode writes its results
+                        to (Default: stdout)""")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        default=1,
+                        help="""The number of processes that batch mode
+                        validates packages in (Default: 1)""")
+    parser.add_argument("--ordered",
+                        action="store_const",
+                        const=True,
+                        help="""Write batch results in the order that the
+                        packages were given rather than as they finish.""")
+    parser.add_argument("--timeout",
+                        type=int,
+                        default=None,
+                        help="""The number of seconds that batch mode
+                        allows each package to take.""")
 
     args = parser.parse_args()
     
@@ -75,20 +136,63 @@ def main():
         sys.exit(1)
 
     expectation = expectations[args.type]
-    error_bundle = validate(args.package,
-                            format=None,
-                            approved_applications=args.approved_applications,
-                            determined=args.determined,
-                            listed=not args.selfhosted)
+    options = {"approved_applications": args.approved_applications,
+               "determined": args.determined,
+               "listed": not args.selfhosted,
+               "ast_cache_dir": args.ast_cache_dir,
+               "file_cache": args.file_cache,
+               "file_workers": args.file_jobs}
+
+    # Batch mode is used for anything other than a single package.
+    if args.batch or args.manifest or args.jobs > 1 or \
+       len(args.package) != 1 or os.path.isdir(args.package[0]):
+        paths = batch.collect_paths(args.package, args.manifest)
+        if not paths:
+            parser.error("No packages were given.")
+
+        output = None
+        if args.batch_output:
+            output = open(args.batch_output, "w")
+        try:
+            if args.jobs > 1:
+                failures = batch.run_parallel(paths,
+                                              args.jobs,
+                                              output,
+                                              ordered=args.ordered,
+                                              timeout=args.timeout,
+                                              expectation=expectation,
+                                              result_cache=args.result_cache,
+                                              **options)
+            else:
+                failures = batch.run_batch(paths,
+                                           output,
+                                           timeout=args.timeout,
+                                           expectation=expectation,
+                                           result_cache=args.result_cache,
+                                           **options)
+        finally:
+            if output is not None:
+                output.close()
+        sys.exit(1 if failures else 0)
+
+    package = args.package[0]
 
     # Print the output of the tests based on the requested format.
     if args.output == "text":
+        error_bundle = validate(package, format=None, **options)
         print error_bundle.print_summary(verbose=args.verbose,
                                          no_color=args.boring)
+        failed = error_bundle.failed()
     elif args.output == "json":
-        sys.stdout.write(error_bundle.render_json())
+        # Only JSON results can be cached.
+        output = validate(package,
+                          format="json",
+                          result_cache=args.result_cache,
+                          **options)
+        sys.stdout.write(output)
+        failed = not json.loads(output)["success"]
 
-    if error_bundle.failed():
+    if failed:
         sys.exit(1)
     else:
         sys.exit(0)
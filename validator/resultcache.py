@@ -0,0 +1,348 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import validator
+
+# The default size limit of a cache (in bytes).
+MAX_CACHE_SIZE = 1024 * 1024 * 1024
+
+# The default number of seconds that a cached result stays valid for.
+CACHE_TTL = 7 * 24 * 60 * 60
+
+# When a cache grows over its limit, the least recently used entries are
+# dropped until it is back down to this fraction of the limit.
+EVICTION_TARGET = 0.9
+
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+# A digest of the data files that the tests go by. Like the tests, each
+# process only reads the files once.
+DEFINITIONS_DIGEST = None
+DEFINITIONS_LOCK = threading.Lock()
+
+
+class ResultCache(object):
+    """A size-bounded store of strings that expire after a given number of
+    seconds. Subclasses implement the actual storage."""
+
+    def __init__(self, max_size=MAX_CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key):
+        "Returns the value stored for a key, or None if there isn't one."
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        "Stores a value for a key."
+        raise NotImplementedError()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+
+class DirectoryResultCache(ResultCache):
+    """Stores each entry as a file in a local directory. The first line of
+    the file holds its creation time and the file's mtime is bumped on
+    every hit, which is what least-recently-used eviction goes by."""
+
+    def __init__(self, path, max_size=MAX_CACHE_SIZE, ttl=CACHE_TTL):
+        ResultCache.__init__(self, max_size, ttl)
+        self.path = path
+        self.size = None
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __reduce__(self):
+        # Worker processes get a cache of their own on the same directory.
+        return (self.__class__, (self.path, self.max_size, self.ttl))
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            entry = open(path, "rb")
+            try:
+                created = float(entry.readline())
+                value = entry.read()
+            finally:
+                entry.close()
+        except (IOError, OSError, ValueError):
+            return None
+
+        try:
+            if self._expired(created):
+                os.remove(path)
+                return None
+            # Touch the entry so that eviction sees it as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        path = self._entry_path(key)
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            # Write the entry out of place so that readers never see a
+            # partial file.
+            handle, temp_path = tempfile.mkstemp(dir=directory)
+            entry = os.fdopen(handle, "wb")
+            try:
+                entry.write("%f\n" % time.time())
+                entry.write(value)
+            finally:
+                entry.close()
+            os.rename(temp_path, path)
+            entry_size = os.path.getsize(path)
+        except (IOError, OSError):
+            return
+
+        self.lock.acquire()
+        try:
+            if self.size is None:
+                self.size = self._total_size()
+            else:
+                self.size += entry_size
+            if self.size > self.max_size:
+                self._evict()
+        finally:
+            self.lock.release()
+
+    def _entries(self):
+        "Returns (mtime, size, path) for each entry in the cache."
+
+        entries = []
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _total_size(self):
+        return sum(size for mtime, size, path in self._entries())
+
+    def _evict(self):
+        "Removes the least recently used entries from the cache."
+
+        entries = self._entries()
+        entries.sort()
+
+        self.size = sum(size for mtime, size, path in entries)
+        target = self.max_size * EVICTION_TARGET
+        for mtime, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+class SQLiteResultCache(ResultCache):
+    "Stores the entries in a single SQLite database."
+
+    def __init__(self, path, max_size=MAX_CACHE_SIZE, ttl=CACHE_TTL):
+        ResultCache.__init__(self, max_size, ttl)
+        self.path = path
+
+        connection = self._connect()
+        try:
+            connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                               "key TEXT PRIMARY KEY, "
+                               "value BLOB, "
+                               "size INTEGER, "
+                               "created REAL, "
+                               "accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed "
+                               "ON results (accessed)")
+            connection.commit()
+        finally:
+            connection.close()
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.max_size, self.ttl))
+
+    def _connect(self):
+        # Connections can't be shared between threads, so each operation
+        # gets its own.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT value, created FROM results "
+                                     "WHERE key = ?", (key, )).fetchone()
+            if row is None:
+                return None
+
+            value, created = row
+            if self._expired(created):
+                connection.execute("DELETE FROM results WHERE key = ?",
+                                   (key, ))
+                value = None
+            else:
+                connection.execute("UPDATE results SET accessed = ? "
+                                   "WHERE key = ?", (time.time(), key))
+            connection.commit()
+            return str(value) if value is not None else None
+        except sqlite3.Error:
+            return None
+        finally:
+            connection.close()
+
+    def set(self, key, value):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("INSERT OR REPLACE INTO results "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               (key, sqlite3.Binary(value), len(value),
+                                now, now))
+            if self.ttl is not None:
+                connection.execute("DELETE FROM results WHERE created < ?",
+                                   (now - self.ttl, ))
+            self._evict(connection)
+            connection.commit()
+        except sqlite3.Error:
+            pass
+        finally:
+            connection.close()
+
+    def _evict(self, connection):
+        "Removes the least recently used entries from the cache."
+
+        size = connection.execute("SELECT SUM(size) FROM results").fetchone()
+        size = size[0] or 0
+        if size <= self.max_size:
+            return
+
+        target = self.max_size * EVICTION_TARGET
+        rows = connection.execute("SELECT key, size FROM results "
+                                  "ORDER BY accessed").fetchall()
+        for key, entry_size in rows:
+            if size <= target:
+                break
+            connection.execute("DELETE FROM results WHERE key = ?", (key, ))
+            size -= entry_size
+
+
+def get_result_cache(location):
+    """Returns the shared cache for a location. Paths ending in .db or
+    .sqlite are opened as SQLite databases; anything else is treated as a
+    directory."""
+
+    CACHES_LOCK.acquire()
+    try:
+        if location not in CACHES:
+            if location.endswith((".db", ".sqlite")):
+                CACHES[location] = SQLiteResultCache(location)
+            else:
+                CACHES[location] = DirectoryResultCache(location)
+        return CACHES[location]
+    finally:
+        CACHES_LOCK.release()
+
+
+def _file_digest(path, digest):
+    "Feeds the contents of a file into a digest."
+
+    file_ = open(path, "rb")
+    try:
+        while True:
+            chunk = file_.read(64 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    finally:
+        file_.close()
+    return digest
+
+
+def _definition_files():
+    """Returns the paths of the data files that the results depend on:
+    the hashes of known libraries, the whitelist (as text or as a
+    database), and the reference language packs and their index."""
+
+    # These modules build on this one, so they can't be imported up top.
+    from validator.testcases import hashindex
+    from validator.testcases import l10ncompleteness
+
+    paths = [os.path.join(hashindex.DEFINITIONS, name) for name in
+             ("hashes.txt", "whitelist_hashes.txt", "whitelist_hashes.db")]
+    if os.path.isdir(l10ncompleteness.LANGPACK_DIR):
+        paths.extend(os.path.join(l10ncompleteness.LANGPACK_DIR, name) for
+                     name in sorted(os.listdir(l10ncompleteness.LANGPACK_DIR)))
+    return paths
+
+
+def definitions_digest():
+    """Returns a digest of the data files that the results depend on, so
+    that cached results go stale when the files are updated."""
+
+    global DEFINITIONS_DIGEST
+
+    DEFINITIONS_LOCK.acquire()
+    try:
+        if DEFINITIONS_DIGEST is None:
+            digest = hashlib.sha256()
+            for path in _definition_files():
+                if not os.path.isfile(path):
+                    continue
+                digest.update("%s\0" % os.path.basename(path))
+                digest.update(_file_digest(path, hashlib.sha256()).digest())
+            DEFINITIONS_DIGEST = digest.hexdigest()
+        return DEFINITIONS_DIGEST
+    finally:
+        DEFINITIONS_LOCK.release()
+
+
+def package_key(path, approved_applications, listed, determined,
+                expectation, spidermonkey=False):
+    """Returns the cache key for the validation of a package. The key
+    covers the package's bytes, the validator version, the list of
+    approved applications, the data files that the tests go by, the
+    Spidermonkey shell that the JS is parsed with (as validate() takes
+    it), and the options that affect the results."""
+
+    # astcache builds on this module, so it can't be imported up top.
+    from validator.constants import SPIDERMONKEY_INSTALLATION
+    from validator.testcases.javascript import astcache
+
+    package_digest = _file_digest(path, hashlib.sha256()).hexdigest()
+    apps_digest = _file_digest(approved_applications,
+                               hashlib.sha256()).hexdigest()
+
+    if spidermonkey is None or SPIDERMONKEY_INSTALLATION is None:
+        shell = "disabled"
+    else:
+        shell = astcache.shell_identity(spidermonkey or
+                                        SPIDERMONKEY_INSTALLATION)
+
+    digest = hashlib.sha256()
+    digest.update("\0".join((package_digest,
+                             validator.__version__,
+                             apps_digest,
+                             definitions_digest(),
+                             shell,
+                             str(bool(listed)),
+                             str(bool(determined)),
+                             str(expectation))))
+    return digest.hexdigest()
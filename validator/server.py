@@ -0,0 +1,350 @@
+import argparse
+import BaseHTTPServer
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import socket
+import SocketServer
+import threading
+import traceback
+import urlparse
+
+import validator
+from validator import batch
+from validator import workerpool
+from validator.constants import *
+from validator.testcases import hashindex
+from validator.testcases import l10ncompleteness
+from validator.testcases.javascript import spidermonkey
+from validator.validate import validate
+
+# The number of requests that may be waiting or running at once. Anything
+# past this is turned away with a 503 so that clients can back off.
+MAX_PENDING = 32
+
+# The number of seconds that a single validation may take.
+JOB_TIMEOUT = 300
+
+# The largest package (in bytes) that may be uploaded.
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+
+# The number of packages that a worker validates before it is replaced.
+MAX_TASKS_PER_CHILD = 200
+
+EXPECTATIONS = {"any": PACKAGE_ANY,
+                "extension": PACKAGE_EXTENSION,
+                "theme": PACKAGE_THEME,
+                "dictionary": PACKAGE_DICTIONARY,
+                "languagepack": PACKAGE_LANGPACK,
+                "search": PACKAGE_SEARCHPROV,
+                "multi": PACKAGE_MULTI}
+
+
+def warm_up():
+    """Loads everything that can be shared by every validation up front,
+    so that the worker processes inherit it rather than loading it
+    themselves."""
+
+    hashindex.get_known_files("whitelist_hashes")
+    hashindex.get_index("hashes.txt")
+    l10ncompleteness.load_reference_packs()
+
+
+def run_validation(job):
+    """Runs a single validation in a worker process and returns the HTTP
+    status and body of the response."""
+
+    path, options, timeout = job
+    try:
+        return (200, batch.call_with_timeout(timeout, validate, path,
+                                             format="json", **options))
+    except batch.JobTimeout:
+        spidermonkey.close_pools()
+        return (504, json.dumps({"error": "Validation timed out after %d "
+                                          "seconds." % timeout}))
+    except Exception:
+        return (500, json.dumps({"error": traceback.format_exc()}))
+
+
+class Dispatcher(object):
+    """Hands validations to a pool of worker processes, or of threads if
+    `threads` is set. No more than `max_pending` validations are accepted
+    at a time. Threads share the Spidermonkey shells and every cache, but
+    can't enforce the timeout."""
+
+    def __init__(self, workers, max_pending=MAX_PENDING,
+                 timeout=JOB_TIMEOUT, options=None, threads=False):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.options = options or {}
+
+        self.pending = 0
+        self.lock = threading.Lock()
+        if threads:
+            self.pool = multiprocessing.pool.ThreadPool(workers)
+        else:
+            self.pool = multiprocessing.Pool(
+                    workers,
+                    initializer=workerpool.init_worker,
+                    maxtasksperchild=MAX_TASKS_PER_CHILD)
+
+    def reserve(self):
+        "Claims a slot for a validation. Returns False if none are free."
+
+        self.lock.acquire()
+        try:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+        finally:
+            self.lock.release()
+
+    def release(self):
+        "Frees a slot claimed with reserve()."
+
+        self.lock.acquire()
+        try:
+            self.pending -= 1
+        finally:
+            self.lock.release()
+
+    def run(self, path, options):
+        """Validates a package in one of the workers and returns the HTTP
+        status and body of the response."""
+
+        job_options = dict(self.options)
+        job_options.update(options)
+        result = self.pool.apply_async(run_validation,
+                                       ((path, job_options, self.timeout), ))
+        try:
+            # Worker processes enforce the timeout themselves; this catches
+            # the ones that died without answering, and threads that run
+            # over.
+            return result.get(self.timeout + 30)
+        except multiprocessing.TimeoutError:
+            return (504, json.dumps({"error": "The validation was lost."}))
+
+    def status(self):
+        return {"pending": self.pending,
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "version": validator.__version__}
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class ValidationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers validation requests:
+
+    GET /status
+        Returns the load of the server.
+    POST /validate?path=<path>
+        Validates a package that is on the server's disk.
+    POST /validate?filename=<name>
+        Validates the package in the request body. The file name (which
+        defaults to package.xpi) is used to tell the type of the package.
+
+    Both forms of /validate accept `type` (any, extension, theme, ...) and
+    `selfhosted` in the query string, and answer with the JSON output of
+    the validator."""
+
+    server_version = "addon-validator/%s" % validator.__version__
+
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path != "/status":
+            return self._respond(404, {"error": "Not found."})
+
+        self._respond(200, self.server.dispatcher.status())
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != "/validate":
+            return self._respond(404, {"error": "Not found."})
+
+        query = dict(urlparse.parse_qsl(url.query))
+        if query.get("type", "any") not in EXPECTATIONS:
+            return self._respond(400, {"error": "Unknown package type."})
+        options = {"expectation": EXPECTATIONS[query.get("type", "any")],
+                   "listed": query.get("selfhosted") not in ("1", "true")}
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._respond(400, {"error": "Bad Content-Length."})
+        if length > MAX_UPLOAD_SIZE:
+            return self._respond(413, {"error": "Package is too large."})
+        if not length and "path" not in query:
+            return self._respond(400, {"error": "No package was given."})
+
+        dispatcher = self.server.dispatcher
+        if not dispatcher.reserve():
+            return self._respond(503, {"error": "Too many requests."},
+                                 {"Retry-After": "5"})
+
+        try:
+            if length:
+                # Uploads are validated in memory rather than being
+                # written out to disk.
+                path = None
+                options["data"] = self._read_upload(length)
+                options["filename"] = os.path.basename(
+                        query.get("filename", "package.xpi"))
+            else:
+                path = query["path"]
+
+            status, body = dispatcher.run(path, options)
+        finally:
+            dispatcher.release()
+
+        self._respond(status, body)
+
+    def _read_upload(self, length):
+        "Reads the package from the request body."
+
+        chunks = []
+        while length > 0:
+            chunk = self.rfile.read(min(length, 64 * 1024))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length -= len(chunk)
+        return "".join(chunks)
+
+    def _respond(self, status, body, headers=None):
+        if not isinstance(body, basestring):
+            body = json.dumps(body)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ValidationServer(SocketServer.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    "An HTTP server that hands its requests to a Dispatcher."
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dispatcher):
+        self.dispatcher = dispatcher
+        BaseHTTPServer.HTTPServer.__init__(self, address, ValidationHandler)
+
+
+class UnixValidationServer(ValidationServer):
+    "A ValidationServer that listens on a Unix socket."
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        SocketServer.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        # Unix sockets don't have client addresses, but the request
+        # handlers log them.
+        request, address = self.socket.accept()
+        return request, ("local", 0)
+
+    def server_close(self):
+        ValidationServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def main(arguments=None):
+    "Runs the validation server until it is interrupted."
+
+    parser = argparse.ArgumentParser(
+        prog="addon-validator serve",
+        description="Serve add-on validations over HTTP.")
+    parser.add_argument("--socket",
+                        default=None,
+                        help="""The path of a Unix socket to listen on.
+                        Takes the place of --host and --port.""")
+    parser.add_argument("--host",
+                        default="127.0.0.1",
+                        help="The address to listen on (Default: 127.0.0.1)")
+    parser.add_argument("--port",
+                        type=int,
+                        default=8099,
+                        help="The port to listen on (Default: 8099)")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="""The number of validations that run at once
+                        (Default: the number of CPUs)""")
+    parser.add_argument("--threads",
+                        action="store_const",
+                        const=True,
+                        help="""Run validations in threads rather than in
+                        worker processes.""")
+    parser.add_argument("--max-pending",
+                        type=int,
+                        default=MAX_PENDING,
+                        help="""The number of requests that may be queued or
+                        running before new ones are refused with a 503.""")
+    parser.add_argument("--timeout",
+                        type=int,
+                        default=JOB_TIMEOUT,
+                        help="""The number of seconds that each validation
+                        may take.""")
+    parser.add_argument("--approved_applications",
+                        default="validator/app_versions.json",
+                        help="""A JSON file containing acceptable applications
+                        and their versions""")
+    parser.add_argument("--ast-cache-dir",
+                        default=None,
+                        help="""A directory in which parsed JavaScript is
+                        cached. Unchanged files will not need to be parsed
+                        again.""")
+    parser.add_argument("--result-cache",
+                        default=None,
+                        help="""A directory (or a SQLite database, if the
+                        path ends in .db) in which results are cached.
+                        Packages that have been validated before with the
+                        same options are answered from the cache.""")
+    parser.add_argument("--file-cache",
+                        default=None,
+                        help="""A directory (or a SQLite database, if the
+                        path ends in .db) in which the messages of each file
+                        are cached. Files that have been seen before are
+                        not tested again.""")
+    args = parser.parse_args(arguments)
+
+    warm_up()
+    dispatcher = Dispatcher(args.jobs,
+                            max_pending=max(args.max_pending, args.jobs),
+                            timeout=args.timeout,
+                            options={"approved_applications":
+                                         args.approved_applications,
+                                     "ast_cache_dir": args.ast_cache_dir,
+                                     "result_cache": args.result_cache,
+                                     "file_cache": args.file_cache},
+                            threads=args.threads)
+
+    if args.socket:
+        server = UnixValidationServer(args.socket, dispatcher)
+    else:
+        server = ValidationServer((args.host, args.port), dispatcher)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.close()
@@ -1,4 +1,5 @@
 import os
+from cStringIO import StringIO
 
 import zipfile
 
@@ -21,24 +22,41 @@ types = {0: "Unknown",
 assumed_extensions = {"jar": PACKAGE_THEME,
                       "xml": PACKAGE_SEARCHPROV}
 
-def prepare_package(err, path, expectation=0):
-    "Prepares a file-based package for validation."
-
-    # Test that the package actually exists. I consider this Tier 0
-    # since we may not even be dealing with a real file.
-    if not os.path.isfile(path):
-        err.reject = True
-        return err.error(("main",
-                          "prepare_package",
-                          "not_found"),
-                         "The package could not be found")
+def prepare_package(err, path=None, expectation=0, filename=None,
+                    data=None):
+    """Prepares a package for validation. `path` is the path of the
+    package file or a seekable file object. A package that is in memory is
+    passed as `data` instead: a string of its contents, a buffer, or a
+    seekable file object. `filename` is only a hint; if it's given, it
+    determines the type of the package in place of the path or the name
+    of the file object."""
+
+    if data is not None:
+        # The data is wrapped as it is, without being copied.
+        package = data if hasattr(data, "read") else StringIO(data)
+        filename = filename or getattr(data, "name", None) or ""
+    elif hasattr(path, "read"):
+        package = path
+        filename = filename or getattr(path, "name", None) or ""
+    else:
+        # Test that the package actually exists. I consider this Tier 0
+        # since we may not even be dealing with a real file.
+        if not os.path.isfile(path):
+            err.reject = True
+            return err.error(("main",
+                              "prepare_package",
+                              "not_found"),
+                             "The package could not be found")
+        package = None
+        filename = filename or path
 
     # Pop the package extension.
-    package_extension = os.path.splitext(path)[1]
+    package_extension = os.path.splitext(filename)[1]
     package_extension = package_extension.lower()
 
     if package_extension == ".xml":
-        return test_search(err, path, expectation)
+        return test_search(err, path if package is None else package,
+                           expectation)
 
     # Test that the package is an XPI.
     if package_extension not in (".xpi", ".jar"):
@@ -48,8 +66,11 @@ def prepare_package(err, path, expectation=0):
                    "unrecognized"),
                   "The package is not of a recognized type.")
 
+    if package is not None:
+        return test_package(err, package, filename, expectation)
+
     package = open(path, "rb")
-    output = test_package(err, package, path, expectation)
+    output = test_package(err, package, filename, expectation)
     package.close()
 
     return output
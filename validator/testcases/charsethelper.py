@@ -1,5 +1,7 @@
-import chardet
 import codecs
+import re
+
+from chardet.universaldetector import UniversalDetector
 
 UNICODES = [
     (codecs.BOM_UTF32_LE, "utf-32-le"),
@@ -9,6 +11,48 @@ UNICODES = [
     (codecs.BOM_UTF8, "utf-8")
     ]
 
+# Detection stops once chardet is this sure of an encoding, or once it has
+# seen this many bytes of the data.
+DETECT_CONFIDENCE = 0.9
+DETECT_MAX_BYTES = 64 * 1024
+DETECT_CHUNK_SIZE = 4 * 1024
+
+# Data that has none of these is plain ASCII. Escape sequences are left to
+# chardet, since they may belong to a 7-bit encoding like ISO-2022-JP.
+NOT_ASCII = re.compile(r"[\x80-\xff\x1b]|~\{")
+
+def detect(data):
+    """Guesses the encoding of data. Returns a dict like chardet.detect()
+    does. Plain ASCII and valid UTF-8 are recognized without chardet."""
+
+    if not NOT_ASCII.search(data):
+        return {"encoding": "ascii", "confidence": 1.0}
+    try:
+        data.decode("utf-8")
+    except UnicodeError:
+        return _detect(data)
+    return {"encoding": "utf-8", "confidence": 1.0}
+
+def _detect(data, max_bytes=DETECT_MAX_BYTES, confidence=DETECT_CONFIDENCE):
+    "Runs chardet over the head of the data until it is sure enough."
+
+    detector = UniversalDetector()
+    for start in range(0, min(len(data), max_bytes), DETECT_CHUNK_SIZE):
+        detector.feed(data[start:start + DETECT_CHUNK_SIZE])
+        if detector.done or _confidence(detector) >= confidence:
+            break
+    detector.close()
+    return detector.result
+
+def _confidence(detector):
+    "Returns the confidence of the prober that is surest so far."
+
+    # The probers aren't public, and their name differs between versions.
+    probers = getattr(detector, "_mCharSetProbers", None) or \
+              getattr(detector, "_charset_probers", None) or []
+    return max([prober.get_confidence() for prober in probers if prober] or
+               [0.0])
+
 def decode(data, encoding="utf-8"):
     "Decode data employing some character set detection and including unicode BOM stripping"
 
@@ -25,11 +69,11 @@ def decode(data, encoding="utf-8"):
     except UnicodeError:
         pass
 
-    # try chardet detection
+    # try chardet detection (the data is neither ASCII nor UTF-8)
     try:
-        detected = chardet.detect(data)
+        detected = _detect(data)
         return unicode(data, detected["encoding"])
-    except:
+    except Exception:
         pass
 
     # try other encodings
@@ -1,18 +1,36 @@
 import hashlib
+import json
 from StringIO import StringIO
 
+import validator
+import validator.resultcache
 from validator import decorator
+from validator import workerpool
 from validator import submain as testendpoint_validator
 import validator.testcases.charsethelper as charsethelper
 import validator.testcases.markup.markuptester as testendpoint_markup
 import validator.testcases.markup.csstester as testendpoint_css
 import validator.testcases.scripting as testendpoint_js
 import validator.testcases.langpack as testendpoint_langpack
+from validator.testcases import hashindex
+from validator.testcases.javascript import spidermonkey
 from validator.xpi import XPIManager
 from validator.chromemanifest import ChromeManifest
+from validator.context import ValidationContext
+from validator.errorbundler import ErrorBundle
 from validator.constants import *
 from validator.textfilter import is_standard_ascii
 
+# The number of files that a package must have for them to be tested in
+# worker processes (if FILE_WORKERS is set).
+MIN_PARALLEL_FILES = 50
+
+# The number of nested packages that a package must have for them to be
+# tested in worker processes.
+MIN_PARALLEL_PACKAGES = 2
+
+# Bumped whenever the format of the file cache's entries changes.
+FILE_CACHE_FORMAT = 2
 
 @decorator.register_test(tier=1)
 def test_xpcnativewrappers(err, package_contents=None, xpi_package=None):
@@ -51,10 +69,72 @@ def test_packed_packages(err, package_contents=None, xpi_package=None):
     
     processed_files = 0
 
-    hash_whitelist = [x[:-1] for x in
-                      open(os.path.join(os.path.dirname(__file__),
-                                        'whitelist_hashes.txt')).readlines()]
+    hash_whitelist = hashindex.get_known_files("whitelist_hashes")
     
+    # Files that haven't changed since they were last seen replay the
+    # messages that they produced then. The messages of everything else are
+    # recorded once the package has been tested.
+    file_cache = err.get_resource("FILE_CACHE")
+    uncached_files = {}
+    file_rejects = {}
+    message_counts = workerpool.message_counts(err)
+
+    def is_whitelisted(name, data):
+        # Files of sizes that nothing in the whitelist has don't need to be
+        # hashed.
+        return hash_whitelist.may_contain_size(data.get("size")) and \
+               xpi_package.get_hash(name) in hash_whitelist
+
+    cached_messages = {}
+    def get_cached_messages(name):
+        if name not in cached_messages:
+            cache_key = _file_cache_key(err, xpi_package.get_hash(name))
+            cached = file_cache.get(cache_key)
+            cached_messages[name] = (cache_key,
+                                     cached and json.loads(cached))
+        return cached_messages[name]
+
+    def test_file(name, extension, file_data):
+        "Tests a file, noting whether the file rejected the package."
+        rejected = err.reject
+        err.reject = False
+        try:
+            return _test_file(err, name, extension, file_data)
+        finally:
+            file_rejects[name] = err.reject
+            err.reject = err.reject or rejected
+
+    # Hand nested packages and files off to worker processes if there are
+    # enough of them.
+    package_tests = file_tests = None
+    workers = err.get_resource("FILE_WORKERS")
+    if workers > 1:
+        package_tests = _start_package_tests(err, package_contents,
+                                             xpi_package, workers,
+                                             is_whitelisted)
+        file_tests = _start_file_tests(err, package_contents, xpi_package,
+                                       workers, is_whitelisted,
+                                       file_cache and get_cached_messages)
+
+    # The JS that is tested here is parsed ahead of time, several files to a
+    # request to the shell.
+    js_files = []
+    for name, data in package_contents.items():
+        if name.startswith("__MACOSX") or \
+           name.startswith(".DS_Store") or \
+           data["extension"] not in ("js", "jsm") or \
+           (file_tests is not None and name in file_tests.names):
+            continue
+        try:
+            file_data = xpi_package.read(name)
+        except KeyError: # pragma: no cover
+            continue
+        if not is_whitelisted(name, data) and \
+           not (file_cache and file_data and
+                get_cached_messages(name)[1] is not None):
+            js_files.append((name, file_data))
+    testendpoint_js.begin_batch(err, js_files, charsethelper.decode)
+
     # Iterate each item in the package.
     for name, data in package_contents.items():
         
@@ -78,22 +158,79 @@ def test_packed_packages(err, package_contents=None, xpi_package=None):
         except KeyError: # pragma: no cover
             _read_error(err, name)
 
-        # Skip over whitelisted hashes
-        hash = hashlib.sha1(file_data).hexdigest()
-        if hash in hash_whitelist:
+        # Skip over whitelisted hashes.
+        if is_whitelisted(name, data):
             continue
 
-        processed = False
+        if file_cache and file_data and \
+           data["extension"] not in ("jar", "xpi"):
+            cache_key, cached = get_cached_messages(name)
+            if cached is not None:
+                _replay_messages(err, name, cached)
+                processed_files += 1
+                continue
+            uncached_files[name] = cache_key
+
         # If that item is a container file, unzip it and scan it.
+        if data["extension"] in ("jar", "xpi"):
+            if package_tests is not None and name in package_tests.names:
+                # The package was tested by a worker.
+                opened, reject, unfinished, messages = \
+                        package_tests.get(name)
+                workerpool.replay_messages(err, messages)
+                err.reject = err.reject or reject
+                err.unfinished = err.unfinished or unfinished
+            else:
+                opened = _test_nested_package(err, name, data, file_data)
+            if not opened:
+                continue
+
+            # This is tested in test_langpack.py
+            if err.detected_type == PACKAGE_LANGPACK:
+                testendpoint_langpack.test_unsafe_html(err,
+                                                       name,
+                                                       file_data)
+        elif file_tests is not None and name in file_tests.names:
+            # The file was tested by a worker.
+            tested, reject, messages = file_tests.get(name)
+            workerpool.replay_messages(err, messages)
+            err.reject = err.reject or reject
+            file_rejects[name] = reject
+            if not tested:
+                continue
+        elif not test_file(name, data["extension"], file_data):
+            continue
+        
+        # This aids in creating unit tests.
+        processed_files += 1
+    
+    testendpoint_js.end_batch(err)
+
+    if uncached_files:
+        _record_messages(err, file_cache, uncached_files, file_rejects,
+                         message_counts)
+
+    return processed_files
+
+
+def _test_nested_package(err, name, data, file_data):
+    """Tests a JAR or XPI that is nested in the package. Returns False if
+    a JAR couldn't be opened."""
+
+    # Resources that the nested package saves (its install.rdf, for one)
+    # belong to it rather than to the package around it, so they're put
+    # back once it's done, as they are when it's tested in a worker.
+    resources = err.resources.copy()
+    try:
         if data["extension"] == "jar":
             # This is either a subpackage or a nested theme.
-            
+        
             # Whether this is a subpackage or a nested theme is
             # determined by whether it is in the root folder or not.
             # Subpackages are always found in a directory such as
             # /chrome or /content.
             is_subpackage = name.count("/") > 0
-            
+        
             # Unpack the package and load it up.
             package = StringIO(file_data)
             sub_xpi = XPIManager(package, name, is_subpackage)
@@ -106,10 +243,10 @@ def test_packed_packages(err, package_contents=None, xpi_package=None):
                           issues with corruption. Ensure that the file
                           is valid.""",
                           name)
-                continue
-            
+                return False
+        
             temp_contents = sub_xpi.get_file_data()
-            
+        
             # Let the error bunder know we're in a sub-package.
             err.push_state(data["name_lower"])
             err.set_type(PACKAGE_SUBPACKAGE) # Subpackage
@@ -119,60 +256,259 @@ def test_packed_packages(err, package_contents=None, xpi_package=None):
             err.tier = 2
             package.close()
             err.pop_state()
-            
-        elif data["extension"] == "xpi":
+        
+        else:
             # It's not a subpackage, it's a nested extension. These are
             # found in multi-extension packages.
-            
+        
             # Unpack!
             package = StringIO(file_data)
-            
+        
             err.push_state(data["name_lower"])
-            
+        
 
             # There are no expected types for packages within a multi-
             # item package.
             testendpoint_validator.test_package(err, package, name)
             err.tier = 2 # Reset to the current tier
-            
+        
             package.close()
             err.pop_state()
+
+        return True
+    finally:
+        err.resources = resources
+
+
+def _test_file(err, name, extension, file_data):
+    """Tests the contents of a single file (other than a nested package).
+    Returns False for empty JS and CSS files, which aren't counted as
+    processed."""
+
+    processed = False
+    if extension in ("xul", "xml", "html", "xhtml"):
+        
+        parser = testendpoint_markup.MarkupParser(err)
+        parser.process(name,
+                       charsethelper.decode(file_data),
+                       extension)
+        
+        processed = True
             
-        elif data["extension"] in ("xul", "xml", "html", "xhtml"):
-            
-            parser = testendpoint_markup.MarkupParser(err)
-            parser.process(name,
-                           charsethelper.decode(file_data),
-                           data["extension"])
-            
-            processed = True
-                
-            
-        elif data["extension"] in ("css", "js", "jsm"):
-            
-            if not file_data:
-                continue
-            file_data = charsethelper.decode(file_data)
-            
-            if data["extension"] == "css":
-                testendpoint_css.test_css_file(err,
+        
+    elif extension in ("css", "js", "jsm"):
+        
+        if not file_data:
+            return False
+        file_data = charsethelper.decode(file_data)
+        
+        if extension == "css":
+            testendpoint_css.test_css_file(err,
+                                           name,
+                                           file_data)
+        elif extension in ("js", "jsm"):
+            testendpoint_js.test_js_file(err,
+                                         name,
+                                         file_data)
+    # This is tested in test_langpack.py
+    if err.detected_type == PACKAGE_LANGPACK and not processed:
+        
+        testendpoint_langpack.test_unsafe_html(err,
                                                name,
                                                file_data)
-            elif data["extension"] in ("js", "jsm"):
-                testendpoint_js.test_js_file(err,
-                                             name,
-                                             file_data)
-        # This is tested in test_langpack.py
-        if err.detected_type == PACKAGE_LANGPACK and not processed:
-            
-            testendpoint_langpack.test_unsafe_html(err,
-                                                   name,
-                                                   file_data)
-        
-        # This aids in creating unit tests.
-        processed_files += 1
-            
-    return processed_files
+
+    return True
+
+
+def _start_package_tests(err, package_contents, xpi_package, workers,
+                         is_whitelisted):
+    """Starts testing the nested packages in a pool of worker processes.
+    Returns an OrderedResults that holds, for each package, whether it
+    could be opened, whether it rejected the package, whether it was left
+    unfinished, and its messages, already merged as pop_state() would.
+    Returns None if there are fewer than MIN_PARALLEL_PACKAGES or if no
+    workers can be started."""
+
+    packages = []
+    for name, data in package_contents.items():
+        if name.startswith("__MACOSX") or \
+           name.startswith(".DS_Store") or \
+           data["extension"] not in ("jar", "xpi"):
+            continue
+        try:
+            file_data = xpi_package.read(name)
+        except KeyError: # pragma: no cover
+            continue
+        if not is_whitelisted(name, data):
+            packages.append((name, data, file_data))
+
+    if len(packages) < MIN_PARALLEL_PACKAGES:
+        return None
+    pool = workerpool.get_pool(workers)
+    if pool is None:
+        return None
+
+    resources = workerpool.picklable_resources(err)
+    context = ValidationContext(
+            approved_applications=err.context.approved_applications,
+            debug=err.context.debug)
+    results = pool.imap_unordered(
+            _test_nested_packages,
+            [(name, data, file_data, err.detected_type, err.tier,
+              err.determined, bool(err.get_resource("listed")), resources,
+              context) for name, data, file_data in packages])
+
+    package_tests = workerpool.OrderedResults(results)
+    package_tests.names = set(name for name, data, file_data in packages)
+    return package_tests
+
+
+def _test_nested_packages(job):
+    """Tests a nested package in a worker process, in a bundle of its own.
+    The nested package pushes and pops its state as it would in the main
+    process, so every message that the bundle ends up with has already
+    been merged under the package's name."""
+
+    (name, data, file_data, detected_type, tier, determined, listed,
+     resources, context) = job
+
+    err = ErrorBundle(determined=determined, listed=listed, context=context)
+    err.set_type(detected_type)
+    err.tier = tier
+    for resource_name, resource in resources.items():
+        err.save_resource(resource_name, resource)
+
+    opened = _test_nested_package(err, name, data, file_data)
+    messages = workerpool.buffer_messages(err,
+                                          {"errors": 0,
+                                           "warnings": 0,
+                                           "notices": 0})
+    return [(name, (opened, err.reject, err.unfinished, messages))]
+
+
+def _start_file_tests(err, package_contents, xpi_package, workers,
+                      is_whitelisted, get_cached_messages):
+    """Starts testing the package's files in a pool of worker processes.
+    Returns an OrderedResults that holds, for each file name, whether the
+    file was tested, whether it rejected the package, and the messages
+    that it produced. Returns None if there aren't enough files to be
+    worth it or if no workers can be started."""
+
+    files = []
+    for name, data in package_contents.items():
+        if name.startswith("__MACOSX") or \
+           name.startswith(".DS_Store") or \
+           data["extension"] in ("jar", "xpi"):
+            continue
+        try:
+            file_data = xpi_package.read(name)
+        except KeyError: # pragma: no cover
+            continue
+        if is_whitelisted(name, data) or \
+           (get_cached_messages and file_data and
+            get_cached_messages(name)[1] is not None):
+            continue
+        files.append((name, data["extension"], file_data))
+
+    if len(files) < MIN_PARALLEL_FILES:
+        return None
+    pool = workerpool.get_pool(workers)
+    if pool is None:
+        return None
+
+    # Contiguous chunks let the JS of each chunk be parsed in batches.
+    chunk_size = max(1, len(files) // (workers * 4))
+    chunks = [files[start:start + chunk_size] for start in
+              range(0, len(files), chunk_size)]
+
+    resources = workerpool.picklable_resources(err)
+    results = pool.imap(_test_files,
+                        [(err.detected_type, err.tier, err.determined,
+                          bool(err.get_resource("listed")), resources,
+                          chunk) for chunk in chunks])
+
+    file_tests = workerpool.OrderedResults(results)
+    file_tests.names = set(name for name, extension, file_data in files)
+    return file_tests
+
+
+def _test_files(job):
+    """Tests a chunk of files in a worker process. The messages of each
+    file are buffered separately."""
+
+    detected_type, tier, determined, listed, resources, files = job
+
+    err = ErrorBundle(determined=determined, listed=listed)
+    err.set_type(detected_type)
+    err.tier = tier
+    for name, resource in resources.items():
+        err.save_resource(name, resource)
+
+    testendpoint_js.begin_batch(err,
+                                [(name, file_data) for
+                                 name, extension, file_data in files if
+                                 extension in ("js", "jsm")],
+                                charsethelper.decode)
+
+    results = []
+    for name, extension, file_data in files:
+        counts = workerpool.message_counts(err)
+        err.reject = False
+        tested = _test_file(err, name, extension, file_data)
+        results.append((name, (tested, err.reject,
+                               workerpool.buffer_messages(err, counts))))
+
+    testendpoint_js.end_batch(err)
+    return results
+    
+
+def _file_cache_key(err, hash):
+    """Returns the key that the messages of a file are cached under. Aside
+    from the file's hash, the key covers everything else that affects the
+    messages that the file produces."""
+
+    key = "\0".join((hash,
+                     validator.__version__,
+                     validator.resultcache.definitions_digest(),
+                     "testcases_content.test_packed_packages",
+                     str(FILE_CACHE_FORMAT),
+                     str(err.detected_type),
+                     str(testendpoint_js.SPIDERMONKEY_INSTALLATION),
+                     str(err.get_resource("SPIDERMONKEY"))))
+    return hashlib.sha1(key).hexdigest()
+
+
+def _record_messages(err, file_cache, files, rejects, message_counts):
+    """Stores the messages that each of the files produced since
+    `message_counts` was taken in the file cache, along with whether the
+    file rejected the package. Files that the JS shell failed on aren't
+    stored, so that they're tested again next time."""
+
+    file_messages = dict((name, []) for name in files)
+    for message in workerpool.buffer_messages(err, message_counts):
+        # Junk file notices are about the name, not the contents.
+        if not isinstance(message["file"], basestring) or \
+           message["file"] not in file_messages or \
+           message["id"][:2] == ("testcases_content",
+                                 "test_packed_packages"):
+            continue
+
+        file_messages[message["file"]].append(message)
+
+    for name, messages in file_messages.items():
+        if any(spidermonkey.is_shell_failure(message) for
+               message in messages):
+            continue
+        file_cache.set(files[name],
+                       json.dumps({"reject": rejects.get(name, False),
+                                   "messages": messages}))
+
+
+def _replay_messages(err, filename, cached):
+    "Adds messages that were recorded by `_record_messages` for a file."
+
+    workerpool.replay_messages(err, cached["messages"], filename)
+    err.reject = err.reject or cached["reject"]
     
 
 def _read_error(err, name): # pragma: no cover
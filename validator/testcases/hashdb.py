@@ -0,0 +1,180 @@
+import binascii
+import mmap
+import os
+import struct
+
+# The layout of the header of a hash database:
+#  - the magic string
+#  - the number of digests in the database
+#  - the size of the bloom filter in bits (zero if there isn't one)
+#  - the number of bloom filter bits that are set for each digest
+#  - the number of distinct file sizes (zero if any size is unknown)
+# The header is followed by the bloom filter, then by the file sizes,
+# sorted, at SIZE_SIZE bytes apiece, and then by the digests themselves,
+# sorted, at DIGEST_SIZE bytes apiece.
+MAGIC = "AMOHASH2"
+HEADER = struct.Struct("<8sQIIQ")
+SIZE = struct.Struct("<Q")
+SIZE_SIZE = SIZE.size
+DIGEST_SIZE = 20
+
+# The number of bloom filter bits per digest. Ten bits and five probes
+# make for a false positive rate of about one percent.
+BLOOM_BITS_PER_DIGEST = 10
+BLOOM_PROBES = 5
+
+
+def _bloom_positions(digest, bits, probes):
+    "Returns the bloom filter bits for a digest."
+
+    # SHA-1 digests are uniformly distributed already, so their words can
+    # be used as the hashes for the filter.
+    words = struct.unpack("<5I", digest)
+    return [words[i] % bits for i in range(probes)]
+
+
+class HashDatabase(object):
+    """A read-only set of SHA-1 digests stored in a sorted binary file,
+    along with the sizes of the files that they were taken from. The file
+    is memory-mapped, so many processes can share the same pages, and
+    lookups are answered with a binary search after the bloom filter has
+    had a chance to turn them down."""
+
+    def __init__(self, path):
+        database = open(path, "rb")
+        try:
+            self.map = mmap.mmap(database.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        finally:
+            database.close()
+
+        if len(self.map) < HEADER.size:
+            raise ValueError("Hash database is truncated.")
+
+        (magic, self.count, self.bloom_bits, self.bloom_probes,
+         self.size_count) = HEADER.unpack(self.map[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("Not a hash database.")
+
+        self.bloom_offset = HEADER.size
+        self.size_offset = self.bloom_offset + self.bloom_bits // 8
+        self.digest_offset = self.size_offset + \
+                             self.size_count * SIZE_SIZE
+
+        if len(self.map) < self.digest_offset + self.count * DIGEST_SIZE:
+            raise ValueError("Hash database is truncated.")
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, hash):
+        if len(hash) == DIGEST_SIZE * 2:
+            try:
+                hash = binascii.unhexlify(hash)
+            except TypeError:
+                return False
+        if len(hash) != DIGEST_SIZE:
+            return False
+
+        if self.bloom_bits:
+            for position in _bloom_positions(hash, self.bloom_bits,
+                                             self.bloom_probes):
+                byte = self.bloom_offset + position // 8
+                if not ord(self.map[byte]) & (1 << (position % 8)):
+                    return False
+
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.digest_offset + middle * DIGEST_SIZE
+            digest = self.map[offset:offset + DIGEST_SIZE]
+            if digest < hash:
+                low = middle + 1
+            elif digest > hash:
+                high = middle
+            else:
+                return True
+        return False
+
+    def may_contain_size(self, size):
+        """Returns whether a file of the given size could be in the
+        database. If the size is unknown, or the database doesn't keep
+        sizes, the answer is always yes."""
+
+        if not self.size_count or size is None:
+            return True
+
+        low = 0
+        high = self.size_count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.size_offset + middle * SIZE_SIZE
+            stored = SIZE.unpack(self.map[offset:offset + SIZE_SIZE])[0]
+            if stored < size:
+                low = middle + 1
+            elif stored > size:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self):
+        self.map.close()
+
+
+def build(digests, path, bloom=True):
+    """Writes a hash database to `path` from an iterable of SHA-1 digests
+    (either raw or as hex strings). Each digest may be paired with the size
+    of the file that it was taken from, as a (digest, size) tuple; the
+    sizes are only stored if every digest has one."""
+
+    unique = set()
+    sizes = set()
+    sized = True
+    for digest in digests:
+        if isinstance(digest, tuple):
+            digest, size = digest
+        else:
+            size = None
+        if size is None:
+            sized = False
+        else:
+            sizes.add(size)
+
+        if len(digest) == DIGEST_SIZE * 2:
+            digest = binascii.unhexlify(digest)
+        if len(digest) != DIGEST_SIZE:
+            raise ValueError("Not a SHA-1 digest: %r" % digest)
+        unique.add(digest)
+    digests = sorted(unique)
+    sizes = sorted(sizes) if sized and digests else []
+
+    bloom_bits = 0
+    bloom_filter = bytearray()
+    if bloom and digests:
+        # Round the filter up to a whole number of bytes.
+        bloom_bits = (len(digests) * BLOOM_BITS_PER_DIGEST + 7) // 8 * 8
+        bloom_filter = bytearray(bloom_bits // 8)
+        for digest in digests:
+            for position in _bloom_positions(digest, bloom_bits,
+                                             BLOOM_PROBES):
+                bloom_filter[position // 8] |= 1 << (position % 8)
+
+    # Write the database out of place so that readers never map a partial
+    # file.
+    temp_path = "%s.tmp" % path
+    database = open(temp_path, "wb")
+    try:
+        database.write(HEADER.pack(MAGIC, len(digests), bloom_bits,
+                                   BLOOM_PROBES, len(sizes)))
+        database.write(str(bloom_filter))
+        for size in sizes:
+            database.write(SIZE.pack(size))
+        for digest in digests:
+            database.write(digest)
+    finally:
+        database.close()
+    os.rename(temp_path, path)
+
+    return len(digests)
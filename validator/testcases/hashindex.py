@@ -0,0 +1,79 @@
+import os
+import threading
+
+from validator.testcases import hashdb
+
+DEFINITIONS = os.path.dirname(__file__)
+
+INDEXES = {}
+INDEXES_LOCK = threading.Lock()
+
+
+class HashIndex(object):
+    """A set of known file hashes. Each line of the definition file holds
+    a SHA-1 hex digest, optionally followed by the size of the file that it
+    was taken from. If every line has a size, files of any other size can
+    be ruled out without hashing them."""
+
+    def __init__(self, path):
+        hashes = set()
+        sizes = set()
+        sized = True
+
+        definitions = open(path)
+        try:
+            for line in definitions:
+                fields = line.split()
+                if not fields:
+                    continue
+                hashes.add(fields[0])
+                if len(fields) > 1:
+                    sizes.add(int(fields[1]))
+                else:
+                    sized = False
+        finally:
+            definitions.close()
+
+        self.hashes = frozenset(hashes)
+        self.sizes = frozenset(sizes) if sized else None
+
+    def __contains__(self, hash):
+        return hash in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def may_contain_size(self, size):
+        """Returns whether a file of the given size could be in the index.
+        If the size is unknown, the answer is always yes."""
+
+        return self.sizes is None or size is None or size in self.sizes
+
+
+def get_index(name):
+    """Returns the index for one of the definition files that live next to
+    this module. Each file is only read once per process. Files ending in
+    .db are opened as binary hash databases."""
+
+    INDEXES_LOCK.acquire()
+    try:
+        if name not in INDEXES:
+            path = os.path.join(DEFINITIONS, name)
+            if name.endswith(".db"):
+                INDEXES[name] = hashdb.HashDatabase(path)
+            else:
+                INDEXES[name] = HashIndex(path)
+        return INDEXES[name]
+    finally:
+        INDEXES_LOCK.release()
+
+
+def get_known_files(name):
+    """Returns the index for a set of known files, preferring the binary
+    database `<name>.db` (see extras/build_whitelist.py) over the text
+    definitions in `<name>.txt`."""
+
+    database = "%s.db" % name
+    if os.path.exists(os.path.join(DEFINITIONS, database)):
+        return get_index(database)
+    return get_index("%s.txt" % name)
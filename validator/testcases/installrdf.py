@@ -67,7 +67,9 @@ def _test_rdf(err, install):
     
     top_id = install.get_root_subject()
     
-    for pred_raw in install.rdf.predicates(top_id, None):
+    # The graph doesn't keep the predicates in any particular order, so
+    # they're sorted to give the same messages in every process.
+    for pred_raw in sorted(install.rdf.predicates(top_id, None)):
         predicate = pred_raw.split("#")[-1]
         
         # Mark that the unpack element has been supplied
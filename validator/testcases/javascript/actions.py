@@ -387,7 +387,7 @@ def _expr_binary(traverser, node):
         try:
             traverser._debug("BIN_EXP>>OPERATION FAILED!")
             output = operators[operator]()
-        except:
+        except Exception:
             return js_traverser.JSWrapper(traverser=traverser)
 
     return js_traverser.JSWrapper(output, traverser=traverser)
@@ -407,6 +407,6 @@ def _get_as_num(value):
         else:
             return int(value)
 
-    except:
+    except Exception:
         return 0
 
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import threading
+
+from validator.resultcache import DirectoryResultCache
+
+# The default size limit of the cache directory (in bytes).
+MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+SHELL_IDENTITIES = {}
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+def shell_identity(shell):
+    """Returns a string that identifies a particular build of the
+    Spidermonkey shell, so that rebuilding or swapping the shell out
+    invalidates everything it has parsed."""
+
+    if shell not in SHELL_IDENTITIES:
+        path = os.path.realpath(shell)
+        try:
+            stat = os.stat(path)
+            SHELL_IDENTITIES[shell] = "%s:%d:%d" % (path,
+                                                    stat.st_size,
+                                                    stat.st_mtime)
+        except OSError:
+            SHELL_IDENTITIES[shell] = path
+    return SHELL_IDENTITIES[shell]
+
+
+class ASTCache(DirectoryResultCache):
+    """A content-addressed, size-bounded cache of Reflect.parse output.
+    Entries are stored as JSON files in a local directory and are keyed by
+    the SHA-1 of the sanitized code and the identity of the shell. ASTs
+    never go stale, so entries only leave the cache through eviction."""
+
+    def __init__(self, path, max_size=MAX_CACHE_SIZE):
+        DirectoryResultCache.__init__(self, path, max_size, ttl=None)
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.max_size))
+
+    def key(self, code, shell):
+        "Returns the cache key for code that is parsed by a given shell."
+
+        digest = hashlib.sha1(shell_identity(shell))
+        digest.update("\0")
+        digest.update(code)
+        return digest.hexdigest()
+
+    def get(self, key):
+        "Returns the cached AST for a key, or None if there isn't one."
+
+        value = DirectoryResultCache.get(self, key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def set(self, key, parsed):
+        "Stores an AST in the cache."
+
+        DirectoryResultCache.set(self, key, json.dumps(parsed))
+
+
+def get_cache(path):
+    "Returns the shared cache for the given directory."
+
+    CACHES_LOCK.acquire()
+    try:
+        if path not in CACHES:
+            CACHES[path] = ASTCache(path)
+        return CACHES[path]
+    finally:
+        CACHES_LOCK.release()
@@ -0,0 +1,393 @@
+import atexit
+import errno
+import json
+import os
+import select
+import subprocess
+import threading
+import time
+
+# The number of shells that a single pool will keep running at once.
+POOL_SIZE = 4
+
+# The number of seconds that a shell may take to answer a request, and to
+# answer a ping. A shell that doesn't answer in time is replaced.
+READ_TIMEOUT = 120
+PING_TIMEOUT = 5
+
+# Workers that have sat idle for longer than this many seconds are pinged
+# before they are handed out again.
+PING_INTERVAL = 30
+
+# The errors that are reported when the shell itself fails, rather than the
+# code that it was given.
+CRASHED = "Spidermonkey shell crashed while parsing."
+TIMED_OUT = "Spidermonkey shell timed out while parsing."
+BAD_OUTPUT = "failed to parse json"
+SHELL_ERRORS = (CRASHED, TIMED_OUT, BAD_OUTPUT)
+
+# The script that each worker shell runs. It reads a length-prefixed JS
+# string literal from stdin, parses the string that it evaluates to, and
+# prints the resulting AST (or the error) as a single line of JSON. Batches
+# are sent as an object literal of string literals and answered with an
+# object of ASTs that share the same keys.
+WORKER_SCRIPT = """
+function parse(code) {
+    try {
+        return Reflect.parse(code);
+    } catch(e) {
+        return {"error": e.toString(), "line": e.lineNumber};
+    }
+}
+while (true) {
+    var length = readline();
+    if (length === null)
+        break;
+    length = parseInt(length, 10);
+    var source = "";
+    while (source.length < length) {
+        var line = readline();
+        if (line === null)
+            break;
+        source += (source ? "\\n" : "") + line;
+    }
+    var request = eval("(" + source + ")");
+    if (typeof request == "string") {
+        print(JSON.stringify(parse(request)));
+    } else {
+        var results = {};
+        for (var id in request)
+            results[id] = parse(request[id]);
+        print(JSON.stringify(results));
+    }
+}
+"""
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class ShellTimeout(IOError):
+    "Raised when a shell doesn't answer in time."
+
+
+class SpiderMonkeyWorker(object):
+    """A long-lived SpiderMonkey shell. JS sources are sent to the shell
+    over stdin and their Reflect.parse output is read back from stdout.
+    Reads give up after `timeout` seconds."""
+
+    def __init__(self, shell, timeout=None):
+        self.shell = shell
+        self.timeout = timeout
+        self.process = None
+        self.pending = ""
+        self.last_used = time.time()
+        self.start()
+
+    def start(self):
+        "Starts the shell process."
+
+        try:
+            self.process = subprocess.Popen([self.shell, "-e", WORKER_SCRIPT],
+                                            shell=False,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=open(os.devnull, "w"),
+                                            close_fds=True)
+        except OSError:
+            self.process = None
+            raise OSError("Spidermonkey shell could not be run.")
+        self.pending = ""
+        self.last_used = time.time()
+
+    def stop(self):
+        "Shuts down the shell process."
+
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+        except (IOError, OSError):
+            pass
+        self.process = None
+
+    def restart(self):
+        "Replaces the shell process with a fresh one."
+
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        "Returns whether the shell process is still running."
+
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self):
+        "Returns whether the shell is running and answering requests."
+
+        if not self.is_alive():
+            return False
+        try:
+            return "error" not in self._request('""', PING_TIMEOUT)
+        except (IOError, ValueError):
+            return False
+
+    def parse(self, source):
+        """Parses `source`, a JS string literal, and returns the decoded
+        output of Reflect.parse. If the shell crashes, it is restarted and
+        the request is retried once. Failures of the shell are returned as
+        errors (see SHELL_ERRORS) like those of the code."""
+
+        for attempt in range(2):
+            if not self.is_alive():
+                self.restart()
+            try:
+                return self._request(source, self.timeout or READ_TIMEOUT)
+            except ShellTimeout:
+                # Asking again would only hang again.
+                self.restart()
+                return {"error": TIMED_OUT, "line": 0}
+            except IOError:
+                self.stop()
+            except ValueError:
+                # The output stream can't be trusted anymore.
+                self.restart()
+                return {"error": BAD_OUTPUT, "line": 0}
+
+        return {"error": CRASHED, "line": 0}
+
+    def _request(self, source, timeout):
+        "Sends a single request to the shell and decodes its response."
+
+        self.process.stdin.write("%d\n%s\n" % (len(source), source))
+        self.process.stdin.flush()
+
+        output = self._readline(timeout)
+        self.last_used = time.time()
+        return json.loads(output, strict=False)
+
+    def _readline(self, timeout):
+        """Reads a line of output from the shell, raising ShellTimeout if it
+        doesn't arrive within `timeout` seconds."""
+
+        deadline = time.time() + timeout
+        fd = self.process.stdout.fileno()
+        chunks = [self.pending]
+        chunk = self.pending
+        while "\n" not in chunk:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ShellTimeout("Spidermonkey shell did not answer.")
+            try:
+                ready = select.select([fd], [], [], remaining)[0]
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                continue
+
+            chunk = os.read(fd, 64 * 1024)
+            if not chunk:
+                raise IOError("Spidermonkey shell exited unexpectedly.")
+            chunks.append(chunk)
+
+        output, self.pending = "".join(chunks).split("\n", 1)
+        return output
+
+
+class SpiderMonkeyPool(object):
+    """A pool of SpiderMonkey workers for a single shell binary. Workers
+    are started lazily and reused for every subsequent parse."""
+
+    def __init__(self, shell, size=POOL_SIZE):
+        self.shell = shell
+        self.size = size
+        self.idle = []
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        "Borrows a healthy worker from the pool, starting one if needed."
+
+        self.condition.acquire()
+        try:
+            while not self.idle and self.running >= self.size:
+                self.condition.wait()
+            if self.idle:
+                worker = self.idle.pop()
+            else:
+                worker = None
+                self.running += 1
+        finally:
+            self.condition.release()
+
+        try:
+            if worker is None:
+                worker = SpiderMonkeyWorker(self.shell)
+            elif not worker.is_alive():
+                worker.restart()
+            elif time.time() - worker.last_used > PING_INTERVAL and \
+                 not worker.ping():
+                # The shell is running but may be stuck.
+                worker.restart()
+        except OSError:
+            self._discard()
+            raise
+
+        return worker
+
+    def release(self, worker):
+        "Returns a worker to the pool."
+
+        if not worker.is_alive():
+            worker.stop()
+            return self._discard()
+
+        self.condition.acquire()
+        try:
+            self.idle.append(worker)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def _discard(self):
+        "Frees the slot of a worker that is no longer usable."
+
+        self.condition.acquire()
+        try:
+            self.running -= 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def parse(self, source):
+        "Parses a JS string literal with one of the pool's workers."
+
+        worker = self.acquire()
+        try:
+            return worker.parse(source)
+        finally:
+            self.release(worker)
+
+    def parse_batch(self, sources):
+        """Parses a dict of JS string literals in a single request and
+        returns a dict of their ASTs with the same keys."""
+
+        return self.parse(_batch_literal(sources))
+
+    def check(self):
+        "Pings each idle worker and restarts the ones that don't answer."
+
+        self.condition.acquire()
+        try:
+            workers, self.idle = self.idle, []
+        finally:
+            self.condition.release()
+
+        for worker in workers:
+            if not worker.ping():
+                try:
+                    worker.restart()
+                except OSError:
+                    pass
+            self.release(worker)
+
+    def resize(self, size):
+        "Changes the number of shells that the pool may keep running."
+
+        self.condition.acquire()
+        try:
+            self.size = size
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def close(self):
+        "Stops every idle worker in the pool."
+
+        self.condition.acquire()
+        try:
+            for worker in self.idle:
+                worker.stop()
+            self.running -= len(self.idle)
+            self.idle = []
+        finally:
+            self.condition.release()
+
+
+def _batch_literal(sources):
+    "Packs a dict of JS string literals into a single object literal."
+
+    return "{%s}" % ",".join("%s:%s" % (json.dumps(str(id)), source) for
+                             id, source in sources.items())
+
+
+def is_shell_failure(message):
+    """Returns whether a message is the warning that is given when the
+    shell itself failed on a JS file (see SHELL_ERRORS). Such a message
+    says nothing about the file and shouldn't be cached."""
+
+    if tuple(message["id"])[-1:] != ("retrieving_tree", ):
+        return False
+
+    description = message["description"]
+    if not isinstance(description, basestring):
+        description = " ".join(description)
+    return any(error in description for error in SHELL_ERRORS)
+
+
+def get_pool(shell):
+    "Returns the shared worker pool for the given shell binary."
+
+    POOLS_LOCK.acquire()
+    try:
+        if shell not in POOLS:
+            POOLS[shell] = SpiderMonkeyPool(shell, POOL_SIZE)
+        return POOLS[shell]
+    finally:
+        POOLS_LOCK.release()
+
+
+def set_pool_size(size):
+    """Sets the number of shells that each pool may keep running, which
+    bounds the number of JS parses in flight across every validation in
+    the process."""
+
+    global POOL_SIZE
+
+    POOLS_LOCK.acquire()
+    try:
+        POOL_SIZE = size
+        for pool in POOLS.values():
+            pool.resize(size)
+    finally:
+        POOLS_LOCK.release()
+
+
+def close_pools():
+    "Stops every worker of every pool."
+
+    POOLS_LOCK.acquire()
+    try:
+        for pool in POOLS.values():
+            pool.close()
+        POOLS.clear()
+    finally:
+        POOLS_LOCK.release()
+
+def reset_pools():
+    """Forgets every pool without stopping its workers. A process that was
+    forked from one with running shells calls this so that it starts its
+    own shells instead of talking to its parent's."""
+
+    POOLS_LOCK.acquire()
+    try:
+        POOLS.clear()
+    finally:
+        POOLS_LOCK.release()
+
+atexit.register(close_pools)
@@ -3,9 +3,12 @@ import tempfile
 import json
 import types
 
+from validator.context import get_context
 from validator.testcases.javascript.nodedefinitions import DEFINITIONS
 from validator.testcases.javascript.predefinedentities import GLOBAL_ENTITIES
 
+# Turns debugging on for every traverser, whatever their bundles' contexts
+# say.
 DEBUG = False
 
 class MockBundler:
@@ -78,18 +81,19 @@ class Traverser:
         self.this_stack = []
 
         # For debugging
+        self.debug = DEBUG or get_context(err).debug
         self.debug_level = 0
     
     def _debug(self, data):
         "Writes a message to the console if debugging is enabled."
-        if DEBUG:
+        if self.debug:
             output = data
             if isinstance(data, JSObject) or isinstance(data, JSContext):
                 output = data.output()
             print ". " * self.debug_level + output
 
     def run(self, data):
-        if DEBUG:
+        if self.debug:
             dof = os.path.join(tempfile.gettempdir(), "output.js")
             x = open(dof, "wb")
             x.write(str(data))
@@ -109,7 +113,7 @@ class Traverser:
         if self.contexts:
             # If we're in debug mode, save a copy of the global context for
             # analysis during unit tests.
-            if DEBUG:
+            if self.debug:
                 self.err.final_context = self.contexts[0]
 
             # This performs the namespace pollution test.
@@ -1,15 +1,19 @@
 import sys
 import os
-import chardet
+import gzip
+import hashlib
 import json
 import fnmatch
+import threading
 from StringIO import StringIO
 
 from validator import decorator
 from validator.chromemanifest import ChromeManifest
+from validator.context import get_context
 from validator.xpi import XPIManager
 from validator.constants import *
 
+import validator.testcases.charsethelper as charsethelper
 import validator.testcases.l10n.dtd as dtd
 import validator.testcases.l10n.properties as properties
 
@@ -26,7 +30,27 @@ L10N_LENGTH_THRESHOLD = 3
 # is not inflated due to small numbers of entities.
 L10N_MIN_ENTITIES = 18
 
-LOCALE_CACHE = {}
+# The number of bytes of decompressed members that each cached locale
+# package holds in memory. The rest are spilled to a temporary file, so the
+# cache can charge each package a known amount.
+LOCALE_MAX_MEMORY = 1024 * 1024
+
+# The files that make up a locale, and those of them that can be parsed.
+L10N_DOCS = ("dtd", "properties", "xhtml", "ini", "inc")
+PARSABLE_DOCS = ("dtd", "properties")
+
+# The reference language packs of each application, and the prebuilt index
+# of their entities (see extras/build_langpack_index.py).
+LANGPACK_DIR = os.path.join(os.path.dirname(__file__), "langpacks")
+LANGPACK_INDEX = os.path.join(LANGPACK_DIR, "index.json.gz")
+
+# Bump this whenever the DTD or properties parsers, or the layout of the
+# index, change. Index entries of other versions are ignored.
+LANGPACK_INDEX_VERSION = 1
+
+LANGPACK_INDEX_DATA = None
+REFERENCE_PACKS = {}
+REFERENCE_PACKS_LOCK = threading.Lock()
 
 def _get_locales(err, xpi_package):
     "Returns a list of locales from the chrome.manifest file."
@@ -64,9 +88,6 @@ def _get_locales(err, xpi_package):
 def _get_locale_manager(err, addon, path, files, no_cache=False):
     "Returns the XPIManager object for a locale"
 
-    if path in LOCALE_CACHE and not no_cache:
-        return LOCALE_CACHE[path]
-
     if path not in files:
         err.warning(("testcases_l10ncompleteness",
                      "_get_locale_manager",
@@ -78,11 +99,24 @@ def _get_locale_manager(err, addon, path, files, no_cache=False):
                      "Missing JAR: %s" % path],
                     filename="chrome.manifest")
         return None
-    jar = StringIO(addon.read(path))
-    locale = XPIManager(jar, path)
 
+    # The locale packages that have been opened belong to the run. They are
+    # told apart by their contents as well as their path.
+    locale_cache = get_context(err).locale_cache
+    key = (addon.get_hash(path), path)
     if not no_cache:
-        LOCALE_CACHE[path] = locale
+        locale = locale_cache.get(key)
+        if locale is not None:
+            return locale
+
+    data = addon.read(path)
+    if no_cache:
+        return XPIManager(StringIO(data), path)
+
+    # The package's memory grows as its members are read, so it's charged
+    # for as much as it may come to hold.
+    locale = XPIManager(StringIO(data), path, max_memory=LOCALE_MAX_MEMORY)
+    locale_cache.set(key, locale, len(data) + LOCALE_MAX_MEMORY)
     return locale
 
 @decorator.register_test(tier=3)
@@ -116,8 +150,16 @@ def test_xpi(err, package_contents, xpi_package):
                                            xpi_package,
                                            reference["path"],
                                            package_contents)
-    # Loop through the locales and test the valid ones.
-    for name, locale in locales.items():
+    if reference_locale is None:
+        get_context(err).locale_cache.clear()
+        return
+
+    # The reference is only parsed once, however many locales there are.
+    reference_locale = ReferenceLocale(reference_locale, reference["target"])
+
+    # Loop through the locales and test the valid ones. Each comparison
+    # only reads from the reference, so they don't depend on each other.
+    for name, locale in sorted(locales.items()):
         # Ignore the reference locale
         if locale["name"] == ref_name:
             continue
@@ -141,7 +183,7 @@ def test_xpi(err, package_contents, xpi_package):
                            ref_name.startswith(split_target[0]))
 
     # Clear the cache at the end of the test
-    L10N_CACHE = {}
+    get_context(err).locale_cache.clear()
 
 @decorator.register_test(tier=3, expected_type=PACKAGE_LANGPACK)
 def test_lp_xpi(err, package_contents, xpi_package):
@@ -168,23 +210,14 @@ def test_lp_xpi(err, package_contents, xpi_package):
                  <em:targetApplication> elements in the install.rdf
                  file.""")
     else:
-        for support in support_references:
-            ref_xpi = XPIManager(os.path.join(os.path.dirname(__file__),
-                                              "langpacks/%s.xpi" % support))
-            ref_xpi.app_name = support
-            reference_locales = _get_locales(None, ref_xpi)
-
-            references.append((ref_xpi, reference_locales))
+        references.extend(support_references)
             
     # Iterate each supported reference package
-    for (ref_xpi, ref_locales) in references:
-        # Iterate each locale in each supported reference package
-        ref_pack = _get_locale_manager(err,
-                                       ref_xpi,
-                                       "en-US.jar",
-                                       ref_xpi.get_file_data(),
-                                       no_cache=True)
-        for ref_locale_name in ref_locales:
+    for support in references:
+        # Only the target locales are parsed; the references come from the
+        # index.
+        ref_locales, ref_pack = get_reference_pack(support)
+        for ref_locale_name in sorted(ref_locales):
             ref_locale = ref_locales[ref_locale_name]
             ref_predicate = ref_locale["predicate"]
             corresp_locales = [locales[name] for name
@@ -210,54 +243,178 @@ def test_lp_xpi(err, package_contents, xpi_package):
             if target_pack is None:
                 continue
 
-            results = _compare_packages(reference=ref_pack,
+            reference = ref_pack.with_base(ref_locale["target"])
+            results = _compare_packages(reference=reference,
                                         target=target_pack,
-                                        ref_base=ref_locale["target"],
                                         locale_base=target_locale["target"])
 
             # Report the findings after each supported app's locale
             _aggregate_results(err, results, target_locale)
     
     # Clear the cache at the end of the test
-    LOCALE_CACHE = {}
+    get_context(err).locale_cache.clear()
+
+class ReferenceLocale(object):
+    """The L10n documents of a reference locale, listed and parsed once so
+    that any number of target locales can be compared against them. The
+    documents are kept in order of name, as (name, parsed document) pairs;
+    documents that can't be parsed have None in place of theirs. Rather
+    than a package, the documents themselves may be given."""
+    
+    def __init__(self, package=None, base="", documents=None):
+        self.base = base.lstrip("/")
+        
+        if documents is not None:
+            self.documents = [(name, document) for name, document in
+                              documents if
+                              not self.base or name.startswith(self.base)]
+            return
+        
+        self.documents = []
+        files = package.get_file_data()
+        for name in sorted(files):
+            # Skip directory entries.
+            if name.endswith("/"): # pragma: no cover
+                continue
+            
+            # Ignore files not considered reference files.
+            if self.base and not name.startswith(self.base):
+                continue
+            
+            extension = name.split(".")[-1]
+            if extension not in L10N_DOCS:
+                continue
+            
+            if extension in PARSABLE_DOCS:
+                document = _parse_l10n_doc(name,
+                                           package.read(name),
+                                           no_encoding=True)
+            else:
+                document = None
+            self.documents.append((name, document))
+    
+    def with_base(self, base):
+        "Returns the part of the reference that is below `base`."
+        
+        return ReferenceLocale(base=base, documents=self.documents)
+
+class IndexedDocument(object):
+    "A reference document that was loaded from the langpack index."
+    
+    def __init__(self, items):
+        self.items = [tuple(item) for item in items]
+        self.entities = dict((name, value) for name, value, line in
+                             self.items)
+    
+    def __len__(self):
+        return len(self.entities)
+
+def index_reference_pack(path):
+    """Lists the locales of a reference language pack and parses the
+    documents of its en-US.jar. Returns them in the form that is stored in
+    the langpack index."""
+    
+    ref_xpi = XPIManager(path)
+    locales = _get_locales(None, ref_xpi)
+    ref_pack = XPIManager(StringIO(ref_xpi.read("en-US.jar")), "en-US.jar")
+    reference = ReferenceLocale(ref_pack)
+    
+    return {"version": LANGPACK_INDEX_VERSION,
+            "sha1": _file_digest(path),
+            "locales": locales,
+            "documents": [(name, document.items if document is not None
+                                 else None) for
+                          name, document in reference.documents]}
+
+def _file_digest(path):
+    reference_file = open(path, "rb")
+    try:
+        return hashlib.sha1(reference_file.read()).hexdigest()
+    finally:
+        reference_file.close()
+
+def _from_json(value):
+    """Turns the strings of the index back into byte strings. The index is
+    written with the latin-1 codec, which maps every byte to a character
+    and back."""
+    
+    if isinstance(value, unicode):
+        return value.encode("latin-1")
+    elif isinstance(value, list):
+        return [_from_json(item) for item in value]
+    elif isinstance(value, dict):
+        return dict((_from_json(key), _from_json(item)) for
+                    key, item in value.items())
+    return value
+
+def _load_langpack_index():
+    "Returns the prebuilt langpack index, or {} if there isn't one."
+    
+    global LANGPACK_INDEX_DATA
+    if LANGPACK_INDEX_DATA is None:
+        try:
+            index_file = gzip.open(LANGPACK_INDEX, "rb")
+            try:
+                LANGPACK_INDEX_DATA = _from_json(json.load(index_file))
+            finally:
+                index_file.close()
+        except (IOError, ValueError):
+            LANGPACK_INDEX_DATA = {}
+    return LANGPACK_INDEX_DATA
+
+def get_reference_pack(app):
+    """Returns the locales of the bundled reference language pack of an
+    application, along with a ReferenceLocale of its en-US.jar. They come
+    from the prebuilt index if it is up to date with the package and the
+    parsers, and are parsed from the package otherwise. Either way, this
+    only happens once per process."""
+    
+    REFERENCE_PACKS_LOCK.acquire()
+    try:
+        if app not in REFERENCE_PACKS:
+            path = os.path.join(LANGPACK_DIR, "%s.xpi" % app)
+            index = _load_langpack_index().get(app)
+            if index is None or \
+               index.get("version") != LANGPACK_INDEX_VERSION or \
+               index["sha1"] != _file_digest(path):
+                index = index_reference_pack(path)
+            
+            documents = [(name, IndexedDocument(items) if items is not None
+                                else None) for
+                         name, items in index["documents"]]
+            REFERENCE_PACKS[app] = (index["locales"],
+                                    ReferenceLocale(documents=documents))
+        return REFERENCE_PACKS[app]
+    finally:
+        REFERENCE_PACKS_LOCK.release()
+
+def load_reference_packs():
+    "Loads the reference language pack of every application up front."
+    
+    for name in sorted(os.listdir(LANGPACK_DIR)):
+        if name.endswith(".xpi"):
+            get_reference_pack(name[:-4])
 
 def _compare_packages(reference, target, ref_base="", locale_base=""):
-    "Compares two L10n-compatible packages to one another."
+    """Compares two L10n-compatible packages to one another. The reference
+    may be a ReferenceLocale, in which case `ref_base` is ignored."""
     
-    ref_files = reference.get_file_data()
+    if not isinstance(reference, ReferenceLocale):
+        reference = ReferenceLocale(reference, ref_base)
     tar_files = target.get_file_data()
     
     results = []
     total_entities = 0
     
-    ref_base = ref_base.lstrip("/")
+    ref_base = reference.base
     locale_base = locale_base.lstrip("/")
     
-    l10n_docs = ("dtd", "properties", "xhtml", "ini", "inc")
-    parsable_docs = ("dtd", "properties")
-    
-    for name, file_data in ref_files.items():
+    for name, ref_doc in reference.documents:
         
         entity_count = 0
         
-        # Skip directory entries.
-        if name.endswith("/"): # pragma: no cover
-            continue
-
-        # Ignore files not considered reference files.
-        if ref_base and not name.startswith(ref_base):
-            continue
-        
-        extension = name.split(".")[-1]
-        if extension not in l10n_docs:
-            continue
-        parsable = extension in parsable_docs
-        
-        if parsable:
-            ref_doc = _parse_l10n_doc(name,
-                                      reference.read(name),
-                                      no_encoding=True)
-        else:
+        parsable = ref_doc is not None
+        if not parsable:
             ref_doc = ()
         
         tar_name = locale_base + name[len(ref_base):]
@@ -336,7 +493,7 @@ def _parse_l10n_doc(name, doc, no_encoding=False):
     
     # Allow the parse to specify files to skip for encoding checks
     if not no_encoding:
-        encoding = chardet.detect(doc)
+        encoding = charsethelper.detect(doc)
         if not encoding \
           or not "encoding" in encoding \
           or not encoding["encoding"]:
@@ -5,9 +5,24 @@ from validator import decorator
 from validator.chromemanifest import ChromeManifest
 from validator.contextgenerator import ContextGenerator
 from validator.constants import PACKAGE_LANGPACK
+from validator.testcases.regexrules import RuleSet
 
 BAD_LINK = '(href|src)=["\'](?!chrome:\/\/)(([a-z]*:)?\/\/|data:)'
 
+# The content that language pack files may not contain.
+UNSAFE_RULES = RuleSet(re.I)
+UNSAFE_RULES.register("<(script|embed|object)",
+                      ("unsafe_content_html",
+                       "Unsafe HTML found in language pack files.",
+                       """Language packs are not allowed to contain scripts,
+                       embeds, or other executable code in the language
+                       definition files."""))
+UNSAFE_RULES.register(BAD_LINK,
+                      ("unsafe_content_link",
+                       "Unsafe remote resource found in language pack.",
+                       """Language packs are not allowed to contain
+                       references to remote resources."""))
+
 @decorator.register_test(tier=2, expected_type=PACKAGE_LANGPACK)
 def test_langpack_manifest(err, package_contents=None, xpi_package=None):
     """Tests the chrome.manifest files in the package for
@@ -67,33 +82,14 @@ def test_unsafe_html(err, filename, data):
     
     context = ContextGenerator(data)
 
-    unsafe_pttrn = re.compile('<(script|embed|object)', re.I)
-    
-    match = unsafe_pttrn.search(data)
-    if match:
-        line = context.get_line(match.start())
-        err.warning(("testcases_langpack",
-                     "test_unsafe_html",
-                     "unsafe_content_html"),
-                    "Unsafe HTML found in language pack files.",
-                    """Language packs are not allowed to contain scripts,
-                    embeds, or other executable code in the language
-                    definition files.""",
-                    filename,
-                    line=line,
-                    context=context)
-    
-    remote_pttrn = re.compile(BAD_LINK, re.I)
-
-    match = remote_pttrn.search(data)
-    if match:
+    for (err_id, message, description), match in \
+            UNSAFE_RULES.first_matches(data):
         line = context.get_line(match.start())
         err.warning(("testcases_langpack",
                      "test_unsafe_html",
-                     "unsafe_content_link"),
-                    "Unsafe remote resource found in language pack.",
-                    """Language packs are not allowed to contain
-                    references to remote resources.""",
+                     err_id),
+                    message,
+                    description,
                     filename,
                     line=line,
                     context=context)
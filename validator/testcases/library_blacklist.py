@@ -1,7 +1,5 @@
-import hashlib
-import os
-
 from validator import decorator
+from validator.testcases import hashindex
 
 @decorator.register_test(tier=1)
 def test_library_blacklist(err, package_contents=None, xpi_package=None):
@@ -16,16 +14,17 @@ def test_library_blacklist(err, package_contents=None, xpi_package=None):
     The hash definitions file that is used by this test can easily be
     generated using the libhasher.py tool."""
     
-    # Generate a tuple of definition data
-    path = os.path.join(os.path.dirname(__file__), 'hashes.txt')
-    lines = open(path).readlines()
-    definitions = [line.strip() for line in lines]
+    # Load up the definition data
+    definitions = hashindex.get_index("hashes.txt")
     
     # Iterate each file
-    for file_ in package_contents:
+    for file_, data in package_contents.items():
+        # Files of sizes that no library has can't be libraries.
+        if not definitions.may_contain_size(data.get("size")):
+            continue
+
         # Open and hash the file
-        data = xpi_package.read(file_)
-        hash_ = hashlib.sha1(data).hexdigest()
+        hash_ = xpi_package.get_hash(file_)
         
         # Test if the file is blocked
         if hash_ in definitions:
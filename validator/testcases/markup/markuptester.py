@@ -7,9 +7,11 @@ except ImportError: # pragma: no cover
 
 import validator.testcases.scripting as scripting
 from validator.testcases.markup import csstester
+from validator.context import get_context
 from validator.contextgenerator import ContextGenerator
 from validator.constants import *
 
+# Turns debugging on for every parser, whatever their bundles' contexts say.
 DEBUG = False
 
 UNSAFE_TAGS = ("script",
@@ -34,6 +36,7 @@ SAFE_IFRAME_TYPES = ("content",
                      "content-primary",
                      "content-targetable")
 TAG_NOT_OPENED = "Tag (%s) being closed before it is opened."
+REMOTE_URL = re.compile("(ht|f)tps?://")
 
 class MarkupParser(HTMLParser):
     """Parses and inspects various markup languages"""
@@ -42,7 +45,7 @@ class MarkupParser(HTMLParser):
         HTMLParser.__init__(self)
         self.err = err
         self.line = 0
-        self.debug = debug
+        self.debug = debug or DEBUG or get_context(err).debug
 
         self.context = None
         
@@ -100,7 +103,7 @@ class MarkupParser(HTMLParser):
         try:
             self.feed(line + "\n")
         except Exception as inst:
-            if DEBUG: # pragma: no cover
+            if self.debug: # pragma: no cover
                 print self.xml_state, inst
             
             if "markup" in self.reported:
@@ -153,7 +156,7 @@ class MarkupParser(HTMLParser):
         if not self_closing:
             self_closing = tag in SELF_CLOSING_TAGS
         
-        if DEBUG: # pragma: no cover
+        if self.debug: # pragma: no cover
             print self.xml_state, tag, self_closing
         
         # A fictional tag for testing purposes.
@@ -183,7 +186,7 @@ class MarkupParser(HTMLParser):
                                  self.filename,
                                  line=self.line,
                                  context=self.context)
-                if DEBUG: # pragma: no cover
+                if self.debug: # pragma: no cover
                     print "Unsafe Tag ------"
             
             # Make sure all src/href attributes are local
@@ -295,7 +298,7 @@ class MarkupParser(HTMLParser):
         
         tag = tag.lower()
         
-        if DEBUG: # pragma: no cover
+        if self.debug: # pragma: no cover
             print tag, self.xml_state
         
         if not self.xml_state:
@@ -311,7 +314,7 @@ class MarkupParser(HTMLParser):
                              line=self.line,
                              context=self.context)
             self.reported["closing_tags"] = True
-            if DEBUG: # pragma: no cover
+            if self.debug: # pragma: no cover
                 print "Too many closing tags ------"
             return
             
@@ -336,7 +339,7 @@ class MarkupParser(HTMLParser):
                              self.filename,
                              line=self.line,
                              context=self.context)
-            if DEBUG: # pragma: no cover
+            if self.debug: # pragma: no cover
                 print "Tag closed before opened ------"
             return
         
@@ -362,7 +365,7 @@ class MarkupParser(HTMLParser):
                              self.filename,
                              line=self.line,
                              context=self.context)
-            if DEBUG: # pragma: no cover
+            if self.debug: # pragma: no cover
                 print "Invalid markup nesting ------"
         
         # Perform analysis on collected data.
@@ -430,7 +433,5 @@ class MarkupParser(HTMLParser):
         if url.startswith("chrome://"):
             return True
         
-        pattern = re.compile("(ht|f)tps?://")
-        
-        return not pattern.match(url)
+        return not REMOTE_URL.match(url)
         
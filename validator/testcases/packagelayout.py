@@ -57,8 +57,8 @@ def test_blacklisted_files(err, package_contents=None, xpi_package=None):
 
         # Perform a deep inspection to detect magic numbers for known binary
         # and executable file types.
-        zip = xpi_package.zf.open(name)
-        bytes = tuple([ord(x) for x in zip.read(4)]) # Longest is 4 bytes
+        head = xpi_package.read_head(name, 4) # Longest is 4 bytes
+        bytes = tuple([ord(x) for x in head])
         if [x for x in blacklisted_magic_numbers if bytes[0:len(x)] == x]:
             err.warning(("testcases_packagelayout",
                          "test_blacklisted_files",
@@ -0,0 +1,65 @@
+import re
+
+# Each module keeps a RuleSet of its own: scripting's rules for JS files and
+# langpack's (case-insensitive) rules for the files of language packs. The
+# two never scan the same text, and Python's regexes can't mix flags within
+# a single pattern, so nothing would be gained by merging them. Patterns that
+# are matched against a single token rather than searched for in a text (like
+# csstester.BAD_URL) don't belong in a RuleSet.
+
+
+class RuleSet(object):
+    """A set of regex rules that are searched for together. The patterns
+    are combined into a single alternation, so a text is scanned once for
+    every rule rather than once per rule. Patterns must not refer back to
+    their groups by number, since the numbers change once combined."""
+
+    def __init__(self, flags=0):
+        self.flags = flags
+        self.rules = []
+        self.scanners = {}
+
+    def register(self, pattern, rule):
+        """Adds a pattern to the set. `rule` is handed back along with the
+        pattern's matches."""
+
+        self.rules.append((re.compile(pattern, self.flags), rule))
+        self.scanners.clear()
+
+    def _scanner(self, indices):
+        "Returns the combined pattern of the given rules."
+
+        key = tuple(indices)
+        if key not in self.scanners:
+            self.scanners[key] = re.compile(
+                    "|".join("(?:%s)" % self.rules[index][0].pattern for
+                             index in indices),
+                    self.flags)
+        return self.scanners[key]
+
+    def first_matches(self, data):
+        """Returns the first match of each rule in a text, as a list of
+        (rule, match) pairs in the order that the rules were registered.
+        Rules that don't match are left out."""
+
+        found = {}
+        pending = range(len(self.rules))
+        position = 0
+        while pending:
+            match = self._scanner(pending).search(data, position)
+            if match is None:
+                break
+
+            # Nothing matches before this position, so every rule that
+            # matches here has its first match here.
+            position = match.start()
+            for index in pending:
+                rule_match = self.rules[index][0].match(data, position)
+                if rule_match is not None:
+                    found[index] = rule_match
+
+            pending = [index for index in pending if index not in found]
+            position += 1
+
+        return [(self.rules[index][1], found[index]) for
+                index in sorted(found)]
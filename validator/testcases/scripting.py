@@ -1,23 +1,49 @@
 import json
 import re
-import subprocess
-# do not use cStringIO as it doesn't support unicode
-from StringIO import StringIO
 
+import validator.testcases.javascript.spidermonkey as spidermonkey
 import validator.testcases.javascript.traverser as traverser
 from validator.constants import SPIDERMONKEY_INSTALLATION
+from validator.context import get_context
 from validator.contextgenerator import ContextGenerator
+from validator.testcases.regexrules import RuleSet
 
 JS_ESCAPE = re.compile(r"\\u")
 WEIRD_CHARS = [chr(c) for c in range(0,32) if "\r\n\t".find(chr(c)) == -1]
-
-def test_js_file(err, filename, data, line=0):
-    "Tests a JS file by parsing and analyzing its tokens"
+WEIRD_CHARS_PATTERN = re.compile(u"[%s]" % re.escape("".join(WEIRD_CHARS)))
+
+NP_WARNING = "Network preferences may not be modified."
+
+# The most JS that a batch sends to the shell in a single request, in bytes
+# of prepared code and in number of files. Larger batches are split up.
+MAX_BATCH_SIZE = 4 * 1024 * 1024
+MAX_BATCH_FILES = 200
+
+# Patterns that are searched for in the raw JS, along with the warning for
+# each.
+REGEX_RULES = RuleSet()
+REGEX_RULES.register("globalStorage\\[.*\\].password",
+                     "Global Storage may not be used to store passwords.")
+REGEX_RULES.register("network\\.http", NP_WARNING)
+REGEX_RULES.register("extensions\\.blocklist\\.url", NP_WARNING)
+REGEX_RULES.register("extensions\\.blocklist\\.level", NP_WARNING)
+REGEX_RULES.register("extensions\\.blocklist\\.interval", NP_WARNING)
+REGEX_RULES.register("general\\.useragent", NP_WARNING)
+
+def test_js_file(err, filename, data, line=0, parsed=None):
+    """Tests a JS file by parsing and analyzing its tokens. If the file is
+    part of a JS batch that was started on the error bundle, it's parsed
+    along with the files that come after it."""
 
     if SPIDERMONKEY_INSTALLATION is None or \
        err.get_resource("SPIDERMONKEY") is None: # Default value is False
         return
 
+    shell = err.get_resource("SPIDERMONKEY") or SPIDERMONKEY_INSTALLATION
+    batch = err.get_resource("js_batch")
+    if parsed is None and batch:
+        parsed = batch.get(err, shell, filename, data)
+
     before_tier = None
     # Set the tier to 4 (Security Tests)
     if err is not None:
@@ -28,9 +54,9 @@ def test_js_file(err, filename, data, line=0):
     try:
         tree = _get_tree(filename,
                          data,
-                         shell=(err and err.get_resource("SPIDERMONKEY")) or
-                               SPIDERMONKEY_INSTALLATION,
-                         errorbundle=err)
+                         shell=shell,
+                         errorbundle=err,
+                         parsed=parsed)
 
     except JSReflectException as exc:
         str_exc = str(exc).strip("'\"")
@@ -63,6 +89,12 @@ def test_js_file(err, filename, data, line=0):
                          "being properly read by the Spidermonkey JS engine.",
                          str(exc)],
                         filename=filename)
+            if exc.value in spidermonkey.SHELL_ERRORS:
+                # The shell failed rather than the code; the other files
+                # can still be tested.
+                if before_tier:
+                    err.tier = before_tier
+                return
             import sys
             etype, err, tb = sys.exc_info()
             raise exc, None, tb
@@ -77,14 +109,14 @@ def test_js_file(err, filename, data, line=0):
         return None
 
     context = ContextGenerator(data)
-    if traverser.DEBUG:
+    if traverser.DEBUG or get_context(err).debug:
         _do_test(err=err, filename=filename, line=line, context=context,
                  tree=tree)
     else:
         try:
             _do_test(err=err, filename=filename, line=line, context=context,
                      tree=tree)
-        except:
+        except Exception:
             # We do this because the validator can still be damn unstable.
             pass
 
@@ -103,6 +135,20 @@ def test_js_snippet(err, data, filename, line=0):
 
     test_js_file(err, filename, data, line)
 
+def begin_batch(err, files, decode=None):
+    """Lets the JS files that are about to be tested against the error
+    bundle be parsed ahead of time, several to a request to the shell.
+    `files` lists the (filename, data) of each file in the order that they
+    will be tested; `decode`, if given, turns the data into what will be
+    passed to test_js_file."""
+
+    err.save_resource("js_batch", JSBatch(files, decode), pushable=True)
+
+def end_batch(err):
+    "Drops whatever is left of the batch started by `begin_batch`."
+
+    err.save_resource("js_batch", None, pushable=True)
+
 def _do_test(err, filename, line, context, tree):
     t = traverser.Traverser(err, filename, line, context=context)
     t.run(tree)
@@ -111,30 +157,72 @@ def _regex_tests(err, data, filename):
 
     c = ContextGenerator(data)
 
-    np_warning = "Network preferences may not be modified."
-
-    errors = {"globalStorage\\[.*\\].password":
-                  "Global Storage may not be used to store passwords.",
-              "network\\.http": np_warning,
-              "extensions\\.blocklist\\.url": np_warning,
-              "extensions\\.blocklist\\.level": np_warning,
-              "extensions\\.blocklist\\.interval": np_warning,
-              "general\\.useragent": np_warning}
-
-    for regex, message in errors.items():
-        reg = re.compile(regex)
-        match = reg.search(data)
-
-        if match:
-            line = c.get_line(match.start())
-            err.warning(("testcases_scripting",
-                         "regex_tests",
-                         "compiled_error"),
-                        "Potentially malicious JS",
-                        message,
-                        filename=filename,
-                        line=line,
-                        context=c)
+    for message, match in REGEX_RULES.first_matches(data):
+        line = c.get_line(match.start())
+        err.warning(("testcases_scripting",
+                     "regex_tests",
+                     "compiled_error"),
+                    "Potentially malicious JS",
+                    message,
+                    filename=filename,
+                    line=line,
+                    context=c)
+
+
+class JSBatch(object):
+    """The JS files that are about to be tested, in the order that they
+    will be tested. When a file comes up that hasn't been parsed yet, it's
+    parsed along with the files after it, up to MAX_BATCH_FILES files and
+    MAX_BATCH_SIZE bytes of code, in a single request to the shell. The
+    files are still tested one at a time as they come up, so their
+    messages are the same as if each had been parsed on its own."""
+
+    def __init__(self, files, decode=None):
+        self.files = [(filename, data) for filename, data in files if data]
+        self.positions = dict((filename, position) for
+                              position, (filename, data) in
+                              enumerate(self.files))
+        self.decode = decode
+        self.position = 0
+        self.trees = {}
+
+    def get(self, err, shell, filename, data):
+        """Returns the shell's output for a file, or None if the file isn't
+        part of the batch or its data isn't what the batch was given."""
+
+        if filename not in self.trees:
+            position = self.positions.get(filename)
+            if position is None or position < self.position:
+                return None
+            self._parse(err, shell, position)
+
+        code, tree = self.trees.pop(filename)
+        return tree if code == data else None
+
+    def _parse(self, err, shell, start):
+        "Parses the files from `start` on, as many as fit in one request."
+
+        sources = {}
+        codes = {}
+        size = 0
+        position = start
+        while position < len(self.files) and \
+              len(sources) < MAX_BATCH_FILES:
+            filename, data = self.files[position]
+            if self.decode is not None:
+                data = self.decode(data)
+            code = _prepare_code(filename, data)
+            if sources and size + len(code) > MAX_BATCH_SIZE:
+                break
+            sources[position] = code
+            codes[position] = data
+            size += len(code)
+            position += 1
+
+        trees = _parse_sources(err, shell, sources)
+        for index in sources:
+            self.trees[self.files[index][0]] = (codes[index], trees[index])
+        self.position = position
 
 
 class JSReflectException(Exception):
@@ -153,72 +241,59 @@ class JSReflectException(Exception):
         return self
 
 def strip_weird_chars(chardata, err=None, name=""):
-    line_num = 1
-    out_code = StringIO()
-    has_warned_ctrlchar = False
-
-    for line in chardata.split(u"\n"):
-        charpos = 0
-        for char in line:
-            if char not in WEIRD_CHARS:
-                out_code.write(char)
-            elif not has_warned_ctrlchar and err is not None:
-                err.warning(("testcases_scripting",
-                             "_get_tree",
-                             "control_char_filter"),
-                             "Invalid control character in JS file",
-                             "An invalid character (ASCII 0-31, except CR "
-                             "and LF) has been found in a JS file. These "
-                             "are considered unsafe and should be removed.",
-                             filename=name,
-                             line=line_num,
-                             column=charpos,
-                             context=ContextGenerator(chardata))
-                has_warned_ctrlchar = True
-
-            charpos += 1
-
-        out_code.write(u"\n")
-        line_num += 1
-    return out_code.getvalue()
-
-def _get_tree(name, code, shell=SPIDERMONKEY_INSTALLATION, errorbundle=None):
-    "Returns an AST tree of the JS passed in `code`."
+    """Strips control characters from JS code and warns about the first one
+    that is found. A newline is always added to the end of the code."""
 
-    if not code:
-        return None
+    match = WEIRD_CHARS_PATTERN.search(chardata)
+    if match is None:
+        return chardata + u"\n"
+
+    if err is not None:
+        _warn_weird_char(err, chardata, match, name)
+
+    return WEIRD_CHARS_PATTERN.sub(u"", chardata) + u"\n"
+
+def _warn_weird_char(err, chardata, match, name):
+    "Warns about the control character that `match` found in the code."
+
+    context = ContextGenerator(chardata)
+    err.warning(("testcases_scripting",
+                 "_get_tree",
+                 "control_char_filter"),
+                 "Invalid control character in JS file",
+                 "An invalid character (ASCII 0-31, except CR "
+                 "and LF) has been found in a JS file. These "
+                 "are considered unsafe and should be removed.",
+                 filename=name,
+                 line=context.get_line(match.start()),
+                 column=context.get_column(match.start()),
+                 context=context)
+
+def _prepare_code(name, code, errorbundle=None):
+    "Sanitizes JS code and returns it as an ASCII JS string literal."
 
-    # Sanitize input
     code = strip_weird_chars(code, errorbundle, name=name)
-    code = JS_ESCAPE.sub("u", json.dumps(code))
-
-    # Because of json.dumps code is already ascii
-    data = """try{
-        print(JSON.stringify(Reflect.parse(%s)));
-    } catch(e) {
-        print(JSON.stringify({
-            "error":e.toString(),
-            "line":e.lineNumber
-        }));
-    }""" % code
+    return JS_ESCAPE.sub("u", json.dumps(code))
 
-    try:
-        process = subprocess.Popen([shell],
-                         shell=False,
-               stdin=subprocess.PIPE,
-              stderr=subprocess.PIPE,
-              stdout=subprocess.PIPE)
-    except OSError:
-        raise OSError("Spidermonkey shell could not be run.")
+def _get_tree(name, code, shell=SPIDERMONKEY_INSTALLATION, errorbundle=None,
+              parsed=None):
+    """Returns an AST tree of the JS passed in `code`. If the code has
+    already been run through the shell, its output can be passed as
+    `parsed`."""
 
-    data, stderr = process.communicate(data)
-    if stderr: raise RuntimeError('Error calling %r: %s' % (cmd, stderr))
+    if not code:
+        return None
 
-    try:
-        parsed = json.loads(data, strict=False)
-    except Exception as ex:
-        # shouldn't happen, obviously, but you never know
-        parsed = json.loads('{"error": "failed to parse json", "line": 0}')
+    if parsed is None:
+        # Because of json.dumps code is already ascii
+        code = _prepare_code(name, code, errorbundle)
+        parsed = _parse_sources(errorbundle, shell, {0: code})[0]
+    elif errorbundle is not None:
+        # Code that was parsed ahead of time was sanitized without the
+        # error bundle, so the warning is given here.
+        match = WEIRD_CHARS_PATTERN.search(code)
+        if match is not None:
+            _warn_weird_char(errorbundle, code, match, name)
 
     if "error" in parsed:
         if parsed["error"].startswith("ReferenceError"):
@@ -228,3 +303,50 @@ def _get_tree(name, code, shell=SPIDERMONKEY_INSTALLATION, errorbundle=None):
             raise JSReflectException(parsed["error"]).line_num(parsed["line"])
 
     return parsed
+
+def _parse_sources(err, shell, sources):
+    """Parses a dict of prepared JS string literals and returns a dict of
+    the shell's output with the same keys. Output that is in the AST cache
+    is taken from there and everything else is parsed in one request."""
+
+    cache = err.get_resource("AST_CACHE") if err is not None else False
+
+    trees = {}
+    keys = {}
+    if cache:
+        for index, code in sources.items():
+            keys[index] = cache.key(code, shell)
+            parsed = cache.get(keys[index])
+            if parsed is not None:
+                trees[index] = parsed
+
+    misses = dict((index, code) for index, code in sources.items() if
+                  index not in trees)
+    if not misses:
+        return trees
+
+    pool = spidermonkey.get_pool(shell)
+    if len(misses) == 1:
+        parsed = dict((str(index), pool.parse(code)) for
+                      index, code in misses.items())
+    else:
+        parsed = pool.parse_batch(misses)
+        if "error" in parsed:
+            # A crash takes the whole batch with it, so fall back on
+            # parsing each source on its own.
+            parsed = {}
+
+    for index, code in misses.items():
+        tree = parsed.get(str(index))
+        if tree is None:
+            tree = pool.parse(code)
+        trees[index] = tree
+
+        # Errors caused by the shell itself rather than the code aren't
+        # worth keeping around.
+        if cache and not ("error" in tree and
+                          (tree["error"].startswith("ReferenceError") or
+                           tree["error"] in spidermonkey.SHELL_ERRORS)):
+            cache.set(keys[index], tree)
+
+    return trees
@@ -1,4 +1,5 @@
 from validator import decorator
+from validator.context import get_context
 from validator.constants import PACKAGE_DICTIONARY, FF4_MIN
 
 APPLICATIONS = {
@@ -10,6 +11,7 @@ APPLICATIONS = {
     "{a23983c0-fd0e-11dc-95ff-0800200c9a66}": "fennec"
 }
 
+# The approved applications for bundles whose context doesn't have any.
 APPROVED_APPLICATIONS = {}
 
 APP_VERSIONS_URL = "Please check the list of valid versions at: "\
@@ -27,6 +29,10 @@ def test_targetedapplications(err, package_contents=None,
     
     install = err.get_resource("install_rdf")
     
+    approved_applications = get_context(err).approved_applications
+    if approved_applications is None:
+        approved_applications = APPROVED_APPLICATIONS
+
     # Search through the install.rdf document for the SeaMonkey
     # GUID string.
     ta_predicate = install.uri("targetApplication")
@@ -50,7 +56,7 @@ def test_targetedapplications(err, package_contents=None,
             
             found_guid = False
             for (guid, key) in [(x["guid"], y) for (y, x) in
-                                    APPROVED_APPLICATIONS.items()]:
+                                    approved_applications.items()]:
                 if guid == ta_guid:
                     found_guid = key
 
@@ -62,7 +68,8 @@ def test_targetedapplications(err, package_contents=None,
                 min_version = install.get_object(target_app, ta_min_ver)
                 max_version = install.get_object(target_app, ta_max_ver)
                 
-                app_versions = APPROVED_APPLICATIONS[found_guid]["versions"]
+                app_versions = \
+                        approved_applications[found_guid]["versions"]
                 
                 # Ensure that the version numbers are in the app's
                 # list of acceptable version numbers.
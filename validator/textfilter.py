@@ -1,3 +1,5 @@
+import re
+
 
 def is_ctrl_char(x, y=None):
     "Returns whether X is an ASCII control character"
@@ -10,8 +12,18 @@ def is_standard_ascii(x):
     y = ord(x)
     return not (is_ctrl_char(x, y) or y > 126)
 
+# Maps every byte that isn't standard ASCII to "?", for str.translate().
+ASCII_TABLE = "".join((chr(y) if is_standard_ascii(chr(y)) else "?") for
+                      y in range(256))
+
+# Matches every character that isn't standard ASCII, for unicode strings.
+NON_ASCII = re.compile(u"[^\t\n\r\x20-\x7e]")
+
 def filter_ascii(text):
+    "Replaces every character that isn't standard ASCII with a ?"
     if isinstance(text, list):
         return [filter_ascii(x) for x in text]
-    return "".join((x if is_standard_ascii(x) else "?") for x in text)
+    if isinstance(text, str):
+        return text.translate(ASCII_TABLE)
+    return NON_ASCII.sub(u"?", text)
 
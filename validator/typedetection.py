@@ -98,7 +98,7 @@ def detect_opensearch(package):
     # Parse the file.
     try:
         srch_prov = parse(package)
-    except:
+    except Exception:
         # Don't worry that it's a catch-all exception handler; it failed
         # and that's all that matters.
         return {"failure": True,
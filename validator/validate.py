@@ -1,45 +1,141 @@
-import json
+import multiprocessing.pool
 import os
+import threading
 from StringIO import StringIO
 
 import validator.loader
+import validator.resultcache
 import validator.submain
 import validator.testcases.targetapplication
+from validator.context import ValidationContext, load_approved_applications
 from validator.errorbundler import ErrorBundle
+from validator.testcases.javascript import astcache
+from validator.testcases.javascript.spidermonkey import is_shell_failure
 from validator.constants import PACKAGE_ANY
 
+# The number of validations that validate_async() runs at once. Any more
+# wait for their turn.
+MAX_ASYNC_VALIDATIONS = 8
 
-def validate(path, format="json",
+ASYNC_POOL = None
+ASYNC_POOL_LOCK = threading.Lock()
+
+
+def validate(path=None, format="json",
              approved_applications=os.path.join(os.path.dirname(__file__),
                                                 "app_versions.json"),
              determined=True,
              spidermonkey=False,
              listed=True,
-             expectation=PACKAGE_ANY):
+             expectation=PACKAGE_ANY,
+             ast_cache_dir=None,
+             result_cache=None,
+             file_cache=None,
+             filename=None,
+             data=None,
+             file_workers=None):
     """Perform validation in one easy step!
     
+    path : The path of the package, or a seekable file object
     format : The format to output the results in
     approved_applications : Path to the list of approved application versions
     determined : Whether the validator should continue after a tier fails
     spidermonkey : Path to the local spidermonkey installation (Default: False)
     listed : True if the add-on is destined for AMO, false if not
     expectation : The type of package that should be expected
+    ast_cache_dir : Directory to cache parsed JS in (Default: None)
+    result_cache : A ResultCache, or the location of one, that JSON results
+                   are stored in and served from (Default: None)
+    file_cache : A ResultCache, or the location of one, that the messages of
+                 individual files are stored in and served from
+                 (Default: None)
+    filename : A file name that determines the type of the package in
+               place of its path (Default: None)
+    data : The package itself, if it's in memory, as a string, a buffer,
+           or a seekable file object (Default: None)
+    file_workers : The number of worker processes that the files of large
+                   packages are tested in (Default: None)
     """
 
-    # Load up the target applications
-    apps = json.load(open(approved_applications))
-    validator.testcases.targetapplication.APPROVED_APPLICATIONS = apps
+    # Identical packages validated with identical options give identical
+    # results, so those can be served straight from the cache.
+    cache_key = None
+    if result_cache is not None and format == "json" and \
+       data is None and filename is None and \
+       isinstance(path, basestring) and os.path.isfile(path):
+        if isinstance(result_cache, basestring):
+            result_cache = \
+                validator.resultcache.get_result_cache(result_cache)
+        cache_key = validator.resultcache.package_key(path,
+                                                      approved_applications,
+                                                      listed,
+                                                      determined,
+                                                      expectation,
+                                                      spidermonkey)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-    bundle = ErrorBundle(listed=listed, determined=determined)
+    # Load up the target applications. They're shared with every other
+    # validation that uses the same list.
+    apps = load_approved_applications(approved_applications)
+    bundle = ErrorBundle(listed=listed, determined=determined,
+                         context=ValidationContext(approved_applications=apps))
     if spidermonkey != False:
         bundle.save_resource("SPIDERMONKEY", spidermonkey)
+    if ast_cache_dir is not None:
+        bundle.save_resource("AST_CACHE", astcache.get_cache(ast_cache_dir))
+    if file_cache is not None:
+        if isinstance(file_cache, basestring):
+            file_cache = validator.resultcache.get_result_cache(file_cache)
+        bundle.save_resource("FILE_CACHE", file_cache)
+    if file_workers:
+        bundle.save_resource("FILE_WORKERS", file_workers)
+
+    validator.submain.prepare_package(bundle, path, expectation,
+                                      filename=filename, data=data)
 
-    validator.submain.prepare_package(bundle, path, expectation)
+    # Report how well the locale packages were reused, so that the limits
+    # of the cache can be tuned.
+    locale_cache = bundle.context.locale_cache
+    if locale_cache.hits or locale_cache.misses:
+        bundle.metadata["locale_cache"] = locale_cache.stats()
 
     # Write the results to the pipe
     formats = {"json": lambda b:b.render_json()}
     if format is not None:
-        return formats[format](bundle)
+        output = formats[format](bundle)
+        # A failure of the shell says nothing about the package, so the
+        # package is validated again next time.
+        if cache_key is not None and \
+           not any(is_shell_failure(message) for
+                   message in bundle.warnings):
+            result_cache.set(cache_key, output)
+        return output
     else:
         return bundle
 
+
+
+def validate_async(path=None, callback=None, **kwargs):
+    """Starts validating a package in the background and returns at once.
+    The arguments are the same as validate()'s. The return value is a
+    multiprocessing AsyncResult: its get() waits for and returns what
+    validate() would have, and `callback` (if given) is called with the
+    same value as soon as it is ready.
+
+    Validations run in a shared pool of MAX_ASYNC_VALIDATIONS threads.
+    The threads spend most of their time waiting on the Spidermonkey
+    shells, so many validations can be in flight at once; the number of
+    shells that they share is set with spidermonkey.set_pool_size()."""
+
+    global ASYNC_POOL
+
+    ASYNC_POOL_LOCK.acquire()
+    try:
+        if ASYNC_POOL is None:
+            ASYNC_POOL = multiprocessing.pool.ThreadPool(MAX_ASYNC_VALIDATIONS)
+    finally:
+        ASYNC_POOL_LOCK.release()
+
+    return ASYNC_POOL.apply_async(validate, (path, ), kwargs, callback)
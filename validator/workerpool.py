@@ -0,0 +1,131 @@
+import cPickle
+import multiprocessing
+import signal
+import threading
+
+from validator.testcases.javascript import spidermonkey
+
+# The number of tasks that each worker process runs before it is replaced.
+MAX_TASKS_PER_CHILD = 100
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def init_worker():
+    "Sets up a freshly forked worker process."
+
+    # Each worker runs its own Spidermonkey shells.
+    spidermonkey.reset_pools()
+    # Interrupts are left for the parent to deal with.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_pool(workers):
+    """Returns the shared pool of `workers` worker processes, or None if
+    this process can't start any (daemonic processes, such as the workers
+    of another pool, can't have children)."""
+
+    if multiprocessing.current_process().daemon:
+        return None
+
+    POOLS_LOCK.acquire()
+    try:
+        if workers not in POOLS:
+            POOLS[workers] = multiprocessing.Pool(
+                    workers,
+                    initializer=init_worker,
+                    maxtasksperchild=MAX_TASKS_PER_CHILD)
+        return POOLS[workers]
+    finally:
+        POOLS_LOCK.release()
+
+
+def close_pools():
+    "Stops the workers of every pool."
+
+    POOLS_LOCK.acquire()
+    try:
+        for pool in POOLS.values():
+            pool.terminate()
+            pool.join()
+        POOLS.clear()
+    finally:
+        POOLS_LOCK.release()
+
+
+def picklable_resources(err):
+    """Returns the resources of an error bundle that can be sent to a
+    worker process. Anything that can't be pickled stays behind."""
+
+    resources = {}
+    for name, resource in err.resources.items():
+        try:
+            cPickle.dumps(resource, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        resources[name] = resource
+    return resources
+
+
+def message_counts(err):
+    "Returns the number of each type of message in the error bundle."
+
+    return {"errors": len(err.errors),
+            "warnings": len(err.warnings),
+            "notices": len(err.notices)}
+
+
+def buffer_messages(err, counts):
+    """Returns the messages that were added to the error bundle since
+    `counts` was taken, in a form that can be sent between processes and
+    replayed with replay_messages()."""
+
+    messages = []
+    for type_ in ("errors", "warnings", "notices"):
+        for message in getattr(err, type_)[counts[type_]:]:
+            messages.append({"type": type_,
+                             "id": message["id"],
+                             "message": message["message"],
+                             "description": message["description"],
+                             "file": message["file"],
+                             "line": message["line"],
+                             "column": message["column"],
+                             "context": err.get_context(message),
+                             "tier": message["tier"]})
+    return messages
+
+
+def replay_messages(err, messages, filename=None):
+    """Adds buffered messages to an error bundle. If `filename` is given,
+    it takes the place of the file that the messages were recorded for."""
+
+    callbacks = {"errors": err.error,
+                 "warnings": err.warning,
+                 "notices": err.notice}
+    for message in messages:
+        context = message["context"]
+        callbacks[message["type"]](tuple(message["id"]),
+                                   message["message"],
+                                   description=message["description"],
+                                   filename=filename or message["file"],
+                                   line=message["line"],
+                                   column=message["column"],
+                                   context=context and tuple(context),
+                                   tier=message["tier"])
+
+
+class OrderedResults(object):
+    """Collects the results of tasks that were handed to a pool with
+    imap(). Each result is a list of (key, value) pairs, and get() waits
+    for as many results as it takes to find a key."""
+
+    def __init__(self, results):
+        self.results = results
+        self.values = {}
+
+    def get(self, key):
+        while key not in self.values:
+            for result_key, value in self.results.next():
+                self.values[result_key] = value
+        return self.values.pop(key)
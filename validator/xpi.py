@@ -1,13 +1,24 @@
+import hashlib
+import tempfile
 import zipfile
 from zipfile import ZipFile
 
+# The number of bytes of decompressed package members that an XPIManager
+# will hold in memory. Anything past this is spilled to a temporary file.
+MAX_MEMORY = 64 * 1024 * 1024
+
 class XPIManager(object):
     """An XPI reader and management class. Allows fun things like
     reading, listing, and extracting files from an XPI without you
-    needing to worry about things like zip files or IO."""
+    needing to worry about things like zip files or IO.
+
+    Each member of the package is decompressed (and CRC-checked) once.
+    The bytes and the SHA-1 of every member that has been read are kept
+    around for every test that needs them afterward."""
     
     
-    def __init__(self, package, name=None, subpackage=False):
+    def __init__(self, package, name=None, subpackage=False,
+                 max_memory=MAX_MEMORY):
         "Create a new managed XPI package"
         
         self.zf = None
@@ -16,7 +27,7 @@ class XPIManager(object):
         try:
             zip_package = ZipFile(package)
             
-        except:
+        except Exception:
             # Pokemon error handling here is unnecessary. If we can't open
             # it, we can't open it. We shouldn't be the "why won't the add-on
             # open" brigade.
@@ -29,17 +40,28 @@ class XPIManager(object):
         
         # Save the reference to the XPI to memory
         self.zf = zip_package
+
+        # The member store. Members are either held in memory or, once
+        # `max_memory` has been used up, spilled to a temporary file.
+        self.max_memory = max_memory
+        self.memory_used = 0
+        self.contents = {}
+        self.spilled = {}
+        self.spill_file = None
+        self.hashes = {}
         
     def test(self):
         """Tests the validity and non-corruptness of the zip.
         
         Will return true on failure."""
         
-        # This guy tests the hashes of the content.
+        # Reading a member checks its CRC, and the contents are kept for
+        # the tests that follow.
         try:
-            output = self.zf.testzip()
-            return output is not None
-        except:
+            for info in self.zf.infolist():
+                self.read(info.filename)
+            return False
+        except Exception:
             return True
         
     def get_file_data(self):
@@ -65,7 +87,42 @@ class XPIManager(object):
     def read(self, filename):
         "Reads a file from the archive and returns a string."
         
+        if filename in self.contents:
+            return self.contents[filename]
+        elif filename in self.spilled:
+            offset, length = self.spilled[filename]
+            self.spill_file.seek(offset)
+            return self.spill_file.read(length)
+
         data = self.zf.read(filename)
+
+        if self.memory_used + len(data) <= self.max_memory:
+            self.contents[filename] = data
+            self.memory_used += len(data)
+        else:
+            if self.spill_file is None:
+                self.spill_file = tempfile.TemporaryFile()
+            self.spill_file.seek(0, 2)
+            self.spilled[filename] = (self.spill_file.tell(), len(data))
+            self.spill_file.write(data)
         
         return data
+
+    def read_head(self, filename, size):
+        "Returns the first `size` bytes of a file from the archive."
+
+        if filename in self.spilled:
+            offset, length = self.spilled[filename]
+            self.spill_file.seek(offset)
+            return self.spill_file.read(min(size, length))
+
+        return self.read(filename)[:size]
+
+    def get_hash(self, filename):
+        "Returns the SHA-1 hex digest of a file from the archive."
+
+        if filename not in self.hashes:
+            self.hashes[filename] = \
+                    hashlib.sha1(self.read(filename)).hexdigest()
+        return self.hashes[filename]
         